@@ -0,0 +1,58 @@
+import threading
+
+SWAP_PENALTY = 20.0 # seconds assumed per model that has to be (re)loaded
+SEM_INPUT_MAP = { # class type : input with a model path
+	"CheckpointLoaderSimple" : "ckpt_name",
+	"CheckpointLoader"       : "ckpt_name",
+	"LoraLoader"             : "lora_name",
+	"VAELoader"              : "vae_name",
+}
+
+def get_model_names(prompt):
+	"""Model files referenced by the loader nodes of a prompt"""
+	out = set()
+	for node in prompt.values():
+		key = SEM_INPUT_MAP.get(node["class_type"])
+		if key and type(node["inputs"].get(key)) == str:
+			out.add(node["inputs"][key])
+	return sorted(out)
+
+def normalize(models):
+	# same model regardless of which OS the path separators came from
+	return set(x.replace("\\", "/") for x in models)
+
+class ModelAffinity:
+	"""
+	Remember which models each remote ran last, so jobs can be routed
+	to a remote that won't have to swap checkpoints/VAEs/LoRAs first.
+	"""
+	def __init__(self):
+		self.loaded = {} # remote_url : set of model names
+		self.swaps = {}  # remote_url : number of model loads caused by us
+		self.lock = threading.Lock()
+
+	def record(self, remote_url, models):
+		models = normalize(models)
+		with self.lock:
+			old = self.loaded.get(remote_url)
+			if old is not None:
+				self.swaps[remote_url] = self.swaps.get(remote_url, 0) + len(models - old)
+			self.loaded[remote_url] = models
+
+	def missing(self, remote_url, models):
+		"""Models that would have to be loaded, assume all of them for unknown remotes"""
+		with self.lock:
+			old = self.loaded.get(remote_url, set())
+		return len(normalize(models) - old)
+
+	def penalty(self, remote_url, models):
+		return self.missing(remote_url, models) * SWAP_PENALTY
+
+	def stats(self):
+		with self.lock:
+			return {
+				"loaded" : {k: sorted(v) for k, v in self.loaded.items()},
+				"swaps"  : dict(self.swaps),
+			}
+
+AFFINITY = ModelAffinity()
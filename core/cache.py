@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "cache")
+CACHE_DISK_SIZE = 4 * 1024**3    # bytes kept on disk before evicting
+CACHE_MEMORY_SIZE = 256 * 1024**2 # bytes of hot entries kept in memory
+MAGIC = b"NDR2"
+
+def result_key(prompt, models=[]):
+	"""Canonical hash of a remote prompt and the models it targets"""
+	data = json.dumps([prompt, sorted(models)], sort_keys=True, separators=(",", ":"))
+	return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def job_size(job):
+	return sum(len(x) for v in job["outputs"].values() for x in v) + sum(len(x) for x in job["extras"].values())
+
+class ResultCache:
+	"""
+	Two tier LRU cache of fetched job results, keyed by result_key.
+	A job is {"outputs": {node: [bytes]}, "images": [bytes], "extras": {kind: bytes}}
+	- the encoded files as downloaded from the remote, images being the
+	files of the final output node. The memory tier holds the hottest entries,
+	the disk tier stores one file per key and evicts by total size.
+	"""
+	def __init__(self, path=CACHE_DIR, disk_size=CACHE_DISK_SIZE, memory_size=CACHE_MEMORY_SIZE):
+		self.path = path
+		self.disk_size = disk_size
+		self.memory_size = memory_size
+		self.memory = OrderedDict() # key : job
+		self.memory_used = 0
+		self.disk = None # key : [size, last_used], scanned on first use
+		self.lock = threading.Lock()
+
+	def _file(self, key):
+		return os.path.join(self.path, f"{key}.ndr")
+
+	def _scan(self):
+		if self.disk is not None:
+			return
+		self.disk = {}
+		if not os.path.isdir(self.path):
+			return
+		for entry in os.scandir(self.path):
+			if entry.name.endswith(".ndr"):
+				stat = entry.stat()
+				self.disk[entry.name[:-4]] = [stat.st_size, stat.st_mtime]
+
+	def _remember(self, key, job):
+		if key in self.memory:
+			self.memory.move_to_end(key)
+			return
+		size = job_size(job)
+		if size > self.memory_size:
+			return
+		self.memory[key] = job
+		self.memory_used += size
+		while self.memory_used > self.memory_size:
+			_, old = self.memory.popitem(last=False)
+			self.memory_used -= job_size(old)
+
+	def contains(self, key):
+		with self.lock:
+			self._scan()
+			return key in self.memory or key in self.disk
+
+	def get(self, key):
+		with self.lock:
+			job = self.memory.get(key)
+			if job is not None:
+				self.memory.move_to_end(key)
+				return job
+			self._scan()
+			if key not in self.disk:
+				return None
+		try:
+			job = self._read(self._file(key))
+		except (OSError, ValueError) as e:
+			print(f"NetDist: dropping unreadable cache entry '{key}'\n", e)
+			self.delete(key)
+			return None
+		with self.lock:
+			if key in self.disk:
+				self.disk[key][1] = time.time()
+			self._remember(key, job)
+		try:
+			os.utime(self._file(key))
+		except OSError: # evicted by a concurrent put, we already have the job
+			pass
+		return job
+
+	def put(self, key, job):
+		os.makedirs(self.path, exist_ok=True)
+		self._write(self._file(key), job)
+		with self.lock:
+			self._scan()
+			self.disk[key] = [os.path.getsize(self._file(key)), time.time()]
+			self._remember(key, job)
+			self._evict()
+
+	def delete(self, key):
+		with self.lock:
+			self._scan()
+			self.disk.pop(key, None)
+			job = self.memory.pop(key, None)
+			if job is not None:
+				self.memory_used -= job_size(job)
+		try:
+			os.remove(self._file(key))
+		except OSError:
+			pass
+
+	def _evict(self):
+		used = sum(x[0] for x in self.disk.values())
+		for key in sorted(self.disk, key=lambda x: self.disk[x][1]):
+			if used <= self.disk_size:
+				break
+			used -= self.disk.pop(key)[0]
+			try:
+				os.remove(self._file(key))
+			except OSError:
+				pass
+
+	def _write(self, path, job):
+		blobs = [x for v in job["outputs"].values() for x in v] + list(job["extras"].values())
+		primary = next((k for k, v in job["outputs"].items() if v is job["images"]), None)
+		head = json.dumps({
+			"outputs" : {k: [len(x) for x in v] for k, v in job["outputs"].items()},
+			"primary" : primary,
+			"extras"  : {k: len(v) for k, v in job["extras"].items()},
+		}).encode("utf-8")
+		tmp = f"{path}.tmp"
+		with open(tmp, "wb") as f:
+			f.write(MAGIC)
+			f.write(struct.pack("<Q", len(head)))
+			f.write(head)
+			for x in blobs:
+				f.write(x)
+		os.replace(tmp, path)
+
+	def _read(self, path):
+		with open(path, "rb") as f:
+			if f.read(len(MAGIC)) != MAGIC:
+				raise ValueError("Not a NetDist result cache file")
+			size = struct.unpack("<Q", f.read(8))[0]
+			head = json.loads(f.read(size).decode("utf-8"))
+			outputs = {k: [f.read(x) for x in v] for k, v in head["outputs"].items()}
+			extras = {k: f.read(v) for k, v in head["extras"].items()}
+		return {"outputs": outputs, "images": outputs.get(head["primary"], []), "extras": extras}
+
+RESULTS = ResultCache()
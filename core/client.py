@@ -0,0 +1,157 @@
+import gzip
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .engine import ENGINE_THREADS, DISPATCH_THREADS, DOWNLOAD_THREADS
+
+try:
+	import orjson # faster JSON encoder
+except ImportError:
+	orjson = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+TIMEOUT = 4        # API calls (queue/prompt/history)
+VIEW_TIMEOUT = 16  # image/file downloads
+RETRIES = 3        # retries for idempotent requests
+BACKOFF = 0.25     # seconds, doubled on each retry
+# keep-alive connections per remote, enough for every job waiter downloading
+# at once plus the dispatches (which also run the scheduler probes)
+POOL_SIZE = ENGINE_THREADS * DOWNLOAD_THREADS + DISPATCH_THREADS
+COMPRESS_MIN = 64 * 1024 # JSON bodies smaller than this are sent as is
+ENCODINGS = (["zstd"] if zstandard else []) + ["gzip"] # preferred first
+
+def dumps(data):
+	"""Compact JSON as bytes"""
+	if orjson is not None:
+		return orjson.dumps(data)
+	return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def compress(body, encoding):
+	if encoding == "zstd":
+		return zstandard.ZstdCompressor(level=3).compress(body)
+	return gzip.compress(body, compresslevel=5)
+
+def encoding_rejected(r):
+	"""
+	Whether an error reply is about the compressed body rather than the request
+	itself, so regular errors (e.g. prompt validation, 400) aren't sent twice.
+	aiohttp answers 400 "Can not decode content-encoding" for a body it can't
+	decompress, and a 500 when it passed through an encoding it doesn't know.
+	"""
+	if r.status_code in (415, 500):
+		return True
+	return r.status_code >= 400 and "content-encoding" in r.text.lower()
+
+class RemoteClient:
+	"""
+	Pooled HTTP client for a single remote ComfyUI instance.
+	Connections are kept alive between polls/downloads and idempotent
+	requests are retried with exponential backoff. Status codes are not
+	raised here, callers still decide how to handle them.
+	"""
+	def __init__(self, remote_url, timeout=TIMEOUT, view_timeout=VIEW_TIMEOUT,
+		retries=RETRIES, backoff=BACKOFF, pool_size=POOL_SIZE):
+		self.url = remote_url.rstrip("/")
+		self.timeout = timeout
+		self.view_timeout = view_timeout
+		self.encodings = list(ENCODINGS) # dropped as the remote turns them down
+
+		retry = Retry(
+			total            = retries,
+			backoff_factor   = backoff,
+			status_forcelist = (502, 503, 504),
+			allowed_methods  = frozenset(["GET", "HEAD"]),
+			raise_on_status  = False,
+		)
+		adapter = HTTPAdapter(
+			pool_connections = 1,
+			pool_maxsize     = pool_size,
+			max_retries      = retry,
+		)
+		self.session = requests.Session()
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+
+	def __repr__(self):
+		return f"RemoteClient({self.url})"
+
+	def get(self, path, timeout=None, **kwargs):
+		return self.session.get(
+			f"{self.url}{path}",
+			timeout = timeout or self.timeout,
+			**kwargs,
+		)
+
+	def post(self, path, timeout=None, **kwargs):
+		return self.session.post(
+			f"{self.url}{path}",
+			timeout = timeout or self.timeout,
+			**kwargs,
+		)
+
+	def post_json(self, path, data, timeout=None):
+		"""
+		POST compact JSON, compressed when it's large enough.
+		If the remote can't decode a compressed body, the same request is retried
+		uncompressed and that encoding isn't used for this remote again.
+		"""
+		body = dumps(data)
+		headers = {"Content-Type": "application/json"}
+		encoding = self.encodings[0] if self.encodings and len(body) >= COMPRESS_MIN else None
+		payload = compress(body, encoding) if encoding else body
+		if encoding:
+			headers["Content-Encoding"] = encoding
+		print(f"NetDist: POST {path} to '{self.url}', {len(body)/1024:.0f}KiB JSON, {len(payload)/1024:.0f}KiB sent ({encoding or 'plain'})")
+
+		r = self.post(path, timeout=timeout, data=payload, headers=headers)
+		if encoding and encoding_rejected(r):
+			plain = self.post(path, timeout=timeout, data=body, headers={"Content-Type": "application/json"})
+			if plain.status_code < 400:
+				print(f"NetDist: '{self.url}' doesn't accept {encoding} request bodies, not using it again")
+				if encoding in self.encodings:
+					self.encodings.remove(encoding)
+			return plain
+		return r
+
+	def view(self, filename, subfolder="", type="output", stream=True):
+		"""Download a file from the remote output/temp/input folders"""
+		return self.get(
+			"/view",
+			params  = {"filename": filename, "subfolder": subfolder, "type": type},
+			timeout = self.view_timeout,
+			stream  = stream,
+		)
+
+	def upload(self, name, data, subfolder="", type="input", overwrite=True):
+		"""Upload an image file to the remote input folder, returns the JSON reply"""
+		r = self.post(
+			"/upload/image",
+			files   = {"image": (name, data)},
+			data    = {"subfolder": subfolder, "type": type, "overwrite": str(overwrite).lower()},
+			timeout = self.view_timeout,
+		)
+		r.raise_for_status()
+		return r.json()
+
+	def close(self):
+		self.session.close()
+
+CLIENTS = {}
+CLIENTS_LOCK = threading.Lock()
+
+def get_client(remote_url):
+	"""Return the shared client for a remote, creating it on first use"""
+	key = remote_url.rstrip("/")
+	with CLIENTS_LOCK:
+		client = CLIENTS.get(key)
+		if client is None:
+			client = RemoteClient(key)
+			CLIENTS[key] = client
+	return client
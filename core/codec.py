@@ -0,0 +1,195 @@
+import json
+import torch
+import struct
+import base64
+import numpy as np
+from io import BytesIO
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# Layout: MAGIC | u8 compression | body
+# body:   u64 header length | JSON header | raw tensor buffers
+# The header is safetensors-like - dtype/shape/offsets per tensor plus
+# JSON metadata. No pickle is involved on either side.
+MAGIC = b"NDT1"
+ALIGN = 8
+COMPRESSION = {"none": 0, "zstd": 1}
+PRECISION = {
+	"fp32" : torch.float32,
+	"fp16" : torch.float16,
+	"bf16" : torch.bfloat16,
+}
+DTYPES = {
+	"float32"  : torch.float32,
+	"float16"  : torch.float16,
+	"bfloat16" : torch.bfloat16,
+	"float64"  : torch.float64,
+	"int64"    : torch.int64,
+	"int32"    : torch.int32,
+	"int16"    : torch.int16,
+	"uint8"    : torch.uint8,
+	"bool"     : torch.bool,
+}
+DTYPE_NAMES = {v: k for k, v in DTYPES.items()}
+
+def is_codec(data):
+	return data[:len(MAGIC)] == MAGIC
+
+def encode_tensors(tensors, meta={}, precision="fp32", compression="none"):
+	"""Serialize a dict of tensors (+ JSON metadata) into bytes"""
+	cast = PRECISION[precision]
+	header = {"tensors": {}, "meta": meta}
+	chunks = []
+	offset = 0
+	for name, tensor in tensors.items():
+		tensor = tensor.detach().cpu().contiguous()
+		orig = tensor.dtype
+		if tensor.is_floating_point() and tensor.dtype != cast:
+			tensor = tensor.to(cast)
+		raw = tensor.reshape(-1).view(torch.uint8).numpy()
+		header["tensors"][name] = {
+			"dtype"   : DTYPE_NAMES[tensor.dtype],
+			"orig"    : DTYPE_NAMES[orig],
+			"shape"   : list(tensor.shape),
+			"offsets" : [offset, offset + raw.nbytes],
+		}
+		chunks.append(raw)
+		offset += raw.nbytes
+		offset += -offset % ALIGN
+
+	head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+	head += b" " * (-len(head) % ALIGN) # keep tensor data aligned
+	if compression == "zstd" and zstandard is None:
+		print("NetDist: zstandard not installed, storing tensors uncompressed")
+		compression = "none"
+
+	out = BytesIO()
+	out.write(MAGIC + bytes([COMPRESSION[compression]]))
+	out.write(struct.pack("<Q", len(head)))
+	out.write(head)
+	for raw in chunks:
+		out.write(raw)
+		out.write(b"\0" * (-raw.nbytes % ALIGN))
+
+	if compression == "zstd":
+		body = out.getbuffer()[len(MAGIC)+1:]
+		return MAGIC + bytes([COMPRESSION[compression]]) + zstandard.ZstdCompressor(level=3).compress(body)
+	return out.getvalue()
+
+def decode_tensors(data):
+	"""Inverse of encode_tensors, returns (tensors, meta)"""
+	if not is_codec(data):
+		raise ValueError("Not a NetDist tensor payload")
+	mode = data[len(MAGIC)]
+	body = memoryview(data)[len(MAGIC)+1:]
+	if mode == COMPRESSION["zstd"]:
+		if zstandard is None:
+			raise ValueError("Payload is zstd compressed but zstandard is not installed")
+		body = zstandard.ZstdDecompressor().decompress(body)
+	elif mode != COMPRESSION["none"]:
+		raise ValueError(f"Unknown compression mode '{mode}'")
+	body = bytearray(body) # single writable copy, tensors below are views into it
+
+	size = struct.unpack_from("<Q", body, 0)[0]
+	header = json.loads(bytes(body[8:8+size]).decode("utf-8"))
+	start = 8 + size
+	tensors = {}
+	for name, info in header["tensors"].items():
+		dtype = DTYPES[info["dtype"]]
+		a, b = info["offsets"]
+		if b > a:
+			tensor = torch.frombuffer(body, dtype=torch.uint8, count=b-a, offset=start+a)
+			tensor = tensor.view(dtype).reshape(info["shape"])
+		else:
+			tensor = torch.zeros(info["shape"], dtype=dtype)
+		if DTYPES[info["orig"]] != dtype:
+			tensor = tensor.to(DTYPES[info["orig"]])
+		tensors[name] = tensor
+	return tensors, header.get("meta", {})
+
+def split_meta(data):
+	"""Split a dict into tensors and JSON serializable values, drop the rest"""
+	tensors, meta = {}, {}
+	for k, v in data.items():
+		if isinstance(v, torch.Tensor):
+			tensors[k] = v
+			continue
+		try:
+			json.dumps(v)
+		except (TypeError, ValueError):
+			print(f"NetDist: skipping non-serializable key '{k}' ({type(v).__name__})")
+			continue
+		meta[k] = v
+	return tensors, meta
+
+def encode_latent(latent, precision="fp32", compression="none"):
+	tensors, meta = split_meta(latent)
+	return encode_tensors(tensors, {"kind": "latent", "extra": meta}, precision, compression)
+
+def decode_latent(data):
+	tensors, meta = decode_tensors(data)
+	latent = dict(meta.get("extra", {}))
+	latent.update(tensors)
+	return latent
+
+def encode_conditioning(conditioning, precision="fp32", compression="none"):
+	"""Conditioning is a list of [cond_tensor, {options}] pairs"""
+	tensors = {}
+	entries = []
+	for k, (cond, options) in enumerate(conditioning):
+		opt_tensors, opt_meta = split_meta(options)
+		tensors[f"{k}"] = cond
+		for name, value in opt_tensors.items():
+			tensors[f"{k}.{name}"] = value
+		entries.append({"tensors": list(opt_tensors.keys()), "meta": opt_meta})
+	return encode_tensors(tensors, {"kind": "conditioning", "entries": entries}, precision, compression)
+
+def decode_conditioning(data):
+	tensors, meta = decode_tensors(data)
+	conditioning = []
+	for k, entry in enumerate(meta["entries"]):
+		options = dict(entry["meta"])
+		for name in entry["tensors"]:
+			options[name] = tensors[f"{k}.{name}"]
+		conditioning.append([tensors[f"{k}"], options])
+	return conditioning
+
+def to_base64(data):
+	return base64.b64encode(data).decode("utf-8")
+
+def from_base64(string):
+	return base64.b64decode(string)
+
+def decode_latent_base64(string):
+	"""Latent samples from either a netdist or a legacy npy base64 string"""
+	data = from_base64(string)
+	if is_codec(data):
+		return decode_latent(data)["samples"]
+	return torch.from_numpy(np.load(BytesIO(data)))
+
+def merge_latent_base64(strings):
+	"""Join per-image latent slices into one batch, keeping the original format"""
+	samples = torch.cat([decode_latent_base64(x) for x in strings])
+	if is_codec(from_base64(strings[0][:8])):
+		return to_base64(encode_latent({"samples": samples}))
+	buffer = BytesIO()
+	np.save(buffer, samples.numpy())
+	return to_base64(buffer.getvalue())
+
+def merge_image_info(infos):
+	"""
+	Combine the PNG text chunks of a fetched batch.
+	Images saved with per-image latent slices get their slices joined
+	back into one latent, everything else is taken from the first image.
+	"""
+	if len(infos) == 0:
+		return {}
+	info = dict(infos[0])
+	slices = [x.get("latent_base64") for x in infos if "latent_slice" in x]
+	if len(slices) > 1 and all(slices):
+		info["latent_base64"] = merge_latent_base64(slices)
+		info.pop("latent_slice", None)
+	return info
@@ -3,15 +3,27 @@ import time
 import json
 import torch
 import random
-import requests
 import numpy as np
 from PIL import Image
-from copy import deepcopy
 
 from .utils import clean_url, get_client_id
+from .client import get_client
+from .registry import REGISTRY
+from .graph import PromptGraph, is_link
+from .overlay import PromptOverlay
+from .patch import apply_patches
+from .events import get_events
+from .fetch import wait_for_update, start_fetch
+from .cache import RESULTS, result_key
+from .affinity import AFFINITY, SEM_INPUT_MAP, get_model_names
+from .upload import UPLOAD_NODES, upload_inputs
+from .template import TEMPLATES, FETCH_SETTINGS, template_key
+from .engine import ENGINE
+from .scheduler import pick_remote
 
 def clear_remote_queue(remote_url):
-	r = requests.get(f"{remote_url}/queue", timeout=4)
+	client = get_client(remote_url)
+	r = client.get("/queue")
 	r.raise_for_status()
 	queue = r.json()
 
@@ -20,129 +32,182 @@ def clear_remote_queue(remote_url):
 	for k in queue.get("queue_pending", []):
 		if k[3].get("client_id") == client_id:
 			to_cancel.append(k[1]) # job UUID
-	r = requests.post(
-		f"{remote_url}/queue",
-		json    = {"delete" : to_cancel},
-		timeout = 4,
-	)
+	r = client.post("/queue", json={"delete" : to_cancel})
 	r.raise_for_status()
 
 	for k in queue.get("queue_running", []):
 		if k[3].get("client_id") == client_id:
-			r = requests.post(
-				f"{remote_url}/interrupt",
-				json    = {},
-				timeout = 4,
-			)
+			r = client.post("/interrupt", json={})
 			r.raise_for_status()
 			break
 
-def get_remote_os(remote_url):
-	url = f"{remote_url}/system_stats"
-	r = requests.get(url, timeout=4)
+def count_remote_jobs(remote_url):
+	"""Number of our jobs currently pending/running on the remote"""
+	r = get_client(remote_url).get("/queue")
 	r.raise_for_status()
-	data = r.json()
-	return data["system"]["os"]
+	queue = r.json()
+	client_id = get_client_id()
+	jobs = queue.get("queue_pending", []) + queue.get("queue_running", [])
+	return len([k for k in jobs if k[3].get("client_id") == client_id])
+
+def wait_for_queue_slot(remote_url, max_inflight):
+	"""Backpressure - block until fewer than max_inflight of our jobs are queued"""
+	events = get_events(remote_url)
+	while True:
+		seq = events.seq if events else None
+		if count_remote_jobs(remote_url) < max_inflight:
+			return
+		wait_for_update(events, seq)
+
+def prepare_remote_queue(remote_url, queue_mode="replace", max_inflight=2):
+	"""
+	replace: cancel/interrupt our previous jobs on the remote (old behavior)
+	append: keep previous jobs, wait until there's room for a new one
+	"""
+	if queue_mode == "append":
+		wait_for_queue_slot(remote_url, max_inflight)
+	else:
+		clear_remote_queue(remote_url)
+
+def get_remote_os(remote_url):
+	return REGISTRY.get_os(remote_url)
 
 def get_output_nodes(remote_url):
 	# I'm 90% sure this could just use the
 	# list from the host but better safe than sorry
-	url = f"{remote_url}/object_info"
-	r = requests.get(url, timeout=4)
-	r.raise_for_status()
-	data = r.json()
-	out = [k for k, v in data.items() if v.get("output_node")]
-	return out
+	return REGISTRY.get_output_nodes(remote_url)
 
 
-def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown", remote_params=[], outputs="final_image"):
-    ### PROMPT LOGIC ###
-    prompt = deepcopy(prompt)
-    to_del = []
-    
-    def recursive_node_deletion(start_node):
-        target_nodes = [start_node]
-        if start_node not in to_del:
-            to_del.append(start_node)
-        while len(target_nodes) > 0:
-            new_targets = []
-            for target in target_nodes:
-                for node in prompt.keys():
-                    inputs = prompt[node].get("inputs")
-                    if not inputs:
-                        continue
-                    for i in inputs.values():
-                        if type(i) == list:
-                            if len(i) > 0 and i[0] in to_del:
-                                if node not in to_del:
-                                    to_del.append(node)
-                                    new_targets.append(node)
-            target_nodes += new_targets
-            target_nodes.remove(target)
+def split_batch(total, count):
+	"""Split a batch as evenly as possible, larger chunks first"""
+	return [total // count + (1 if k < total % count else 0) for k in range(count)]
 
+def plan_remote_prompt(remote_url, prompt, outputs="final_image"):
+    """
+    Structural part of build_remote_prompt - which queue nodes run on this
+    remote, which nodes get pruned and what output nodes replace the fetch
+    nodes. Only depends on what template_key covers, so it's cached.
+    """
     # find current node and disable all others
+    enabled = {}
     output_src = None
     for i in prompt.keys():
         if prompt[i]["class_type"].startswith("RemoteQueue"):
-            if clean_url(prompt[i]["inputs"]["remote_url"]) == remote_url:
-                prompt[i]["inputs"]["enabled"] = "remote"
+            if remote_url in clean_url(prompt[i]["inputs"]["remote_url"], multi=True):
+                enabled[i] = "remote"
                 output_src = i
-                # Apply remote parameters
-                for param, value, nodeid in remote_params:
-                    if nodeid:
-                        for node_key, node_data in prompt.items():
-                            if node_key == nodeid:
-                                if param in node_data.get("inputs", {}):
-                                    prompt[node_key]["inputs"][param] = value
-                                    break
-                    else:
-                        if param in prompt[i]["inputs"]:
-                            prompt[i]["inputs"][param] = value
-                        else:
-                            # If the parameter doesn't exist in the node's inputs,
-                            # we need to find where to apply it in the prompt
-                            for node_key, node_data in prompt.items():
-                                if param in node_data.get("inputs", {}):
-                                    prompt[node_key]["inputs"][param] = value
-                                    break
             else:
-                prompt[i]["inputs"]["enabled"] = "false"
-    
+                enabled[i] = "false"
+
     banned = [] if outputs == "any" else ["PreviewImage", "SaveImage"] # get_output_nodes(remote_url)
-    output = None
-    for i in prompt.keys():
-        # only leave current fetch but replace with PreviewImage
-        if prompt[i]["class_type"] == "FetchRemote":
-            if prompt[i]["inputs"]["remote_info"][0] == output_src:
-                output = {
-                    "inputs": {"images": prompt[i]["inputs"]["final_image"]},
-                    "class_type": 'PreviewImage',
-                    "final_output": True, # might allow multiple outputs with an ID?
-                }
-            recursive_node_deletion(i)
-        # do not save output on remote
-        if prompt[i]["class_type"] in banned:
-            recursive_node_deletion(i)
-    if output:
-        prompt[str(max([int(x) for x in prompt.keys()])+1)] = output
-    for i in to_del: del prompt[i]
+    graph = PromptGraph(prompt)
+    output = {} # fetch node : output node replacing it on the remote
+    to_del = graph.nodes_of_class(*banned)
+    # only leave the current fetch nodes but replace them with PreviewImage
+    for i in graph.nodes_of_class("FetchRemote"):
+        if prompt[i]["inputs"]["remote_info"][0] == output_src:
+            output[i] = {
+                "inputs": {"images": prompt[i]["inputs"]["final_image"]},
+                "class_type": 'PreviewImage',
+            }
+            wire_format = prompt[i]["inputs"].get("wire_format", "png")
+            if wire_format != "png":
+                output[i]["class_type"] = 'PreviewImageNetDist'
+                output[i]["inputs"]["wire_format"] = wire_format
+                output[i]["inputs"]["quality"] = prompt[i]["inputs"].get("quality", 90)
+        to_del.append(i)
+    # latent fetch skips the VAE decode/PNG round trip
+    for i in graph.nodes_of_class("FetchRemoteLatent"):
+        if prompt[i]["inputs"]["remote_info"][0] == output_src:
+            output[i] = {
+                "inputs": {
+                    "samples"   : prompt[i]["inputs"]["final_latent"],
+                    "precision" : prompt[i]["inputs"].get("precision", "fp32"),
+                },
+                "class_type": 'PreviewLatentNetDist',
+            }
+        to_del.append(i)
+    # one remote output per fetch node, the first one is the default
+    added = {}
+    next_id = max([int(x) for x in prompt.keys()]) + 1
+    for k, (i, node) in enumerate(output.items()):
+        node["netdist_fetch"] = i
+        if k == 0:
+            node["final_output"] = True
+        added[str(next_id + k)] = node
+    # do not save output on remote
+    removed = graph.downstream(to_del)
+    kept = [i for i in prompt.keys() if i not in removed]
+    return {
+        "enabled" : enabled,
+        "removed" : list(removed),
+        "added"   : added,
+        "loaders" : [i for i in kept if prompt[i]["class_type"] in UPLOAD_NODES],
+        "models"  : [i for i in kept if prompt[i]["class_type"] in SEM_INPUT_MAP],
+    }
+
+def build_remote_prompt(remote_url, prompt, remote_params=[], outputs="final_image", node_inputs={}):
+    """Create the prompt as the remote should see it"""
+    key = template_key(remote_url, prompt, outputs, node_inputs)
+    template = TEMPLATES.get(key)
+    if template is None:
+        template = plan_remote_prompt(remote_url, prompt, outputs)
+        TEMPLATES.put(key, template)
+
+    ### PROMPT LOGIC ###
+    prompt = PromptOverlay(prompt) # only the nodes we touch get copied
+    patches = {(nodeid, param): value for param, value, nodeid in remote_params}
+    for i, state in template["enabled"].items():
+        prompt.set_input(i, "enabled", state)
+        if state == "remote":
+            prompt.update_inputs(i, node_inputs)
+            # Apply remote parameters, node-less ones go to this node if it has the input
+            apply_patches(prompt, patches, default=i, struct=key)
+    for i in template["removed"]:
+        del prompt[i]
+    for i, node in template["added"].items():
+        prompt[i] = {**node, "inputs": dict(node["inputs"])}
+
+    ### INPUT FILES ###
+    upload_inputs(remote_url, prompt, template["loaders"])
 
     ### OS LOGIC ###
     sep_remote = "\\" if get_remote_os(remote_url) == "nt" else "/"
     sep_local  = "\\" if os.name == "nt" else "/"
-    sem_input_map = { # class type : input to replace
-        "CheckpointLoaderSimple" : "ckpt_name",
-        "CheckpointLoader"       : "ckpt_name",
-        "LoraLoader"             : "lora_name",
-        "VAELoader"              : "vae_name",
-    }
     if sep_remote != sep_local:
-        for i in prompt.keys():
-            if prompt[i]["class_type"] in sem_input_map.keys():
-                key = sem_input_map[prompt[i]["class_type"]]
-                prompt[i]["inputs"][key] = prompt[i]["inputs"][key].replace(sep_local, sep_remote)
+        for i in template["models"]:
+            key = SEM_INPUT_MAP[prompt[i]["class_type"]]
+            prompt.set_input(i, key, prompt[i]["inputs"][key].replace(sep_local, sep_remote))
+    return prompt
+
+def fetch_nodes(prompt, source):
+    """Fetch nodes of any kind reading the output of a queue node"""
+    return [k for k, v in prompt.items()
+        if v["class_type"].startswith("FetchRemote") and (v["inputs"].get("remote_info") or [None])[0] == source]
+
+def fetch_settings(prompt, source):
+    """
+    Settings of the fetch nodes reading a queue node that end up in the
+    remote prompt (wire format, precision), so the queue node's IS_CHANGED
+    includes them to dispatch again when they change.
+    """
+    if not prompt or not source:
+        return ""
+    data = []
+    for i in sorted(fetch_nodes(prompt, source)):
+        inputs = prompt[i]["inputs"]
+        data.append((i, {k: inputs[k] for k in FETCH_SETTINGS if k in inputs and not is_link(inputs[k])}))
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
 
+def count_fetch_nodes(prompt, remote_prompt):
+    """Fetch nodes reading the output of the queue node running on this remote"""
+    source = [k for k, v in remote_prompt.items() if v.get("inputs", {}).get("enabled") == "remote"]
+    return len(fetch_nodes(prompt, source[-1])) if source else 0
+
+def submit_prompt(remote_url, prompt, job_id):
+    """Queue an already prepared prompt on the remote, returns the prompt_id"""
     ### SEND REQUEST ###
+    get_events(remote_url) # start listening before the job can finish
     data = {
         "prompt": prompt,
         "client_id": get_client_id(),
@@ -150,11 +215,91 @@ def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown",
             "job_id": job_id,
         }
     }
-    ar = requests.post(
-        f"{remote_url}/prompt",
-        data    = json.dumps(data),
-        headers = {"Content-Type": "application/json"},
-        timeout = 4,
-    )
+    ar = get_client(remote_url).post_json("/prompt", data)
     ar.raise_for_status()
-    return
+    return ar.json().get("prompt_id")
+
+def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown", remote_params=[], outputs="final_image", node_inputs={}):
+    prompt = build_remote_prompt(remote_url, prompt, remote_params, outputs, node_inputs)
+    return submit_prompt(remote_url, prompt, job_id)
+
+def queue_on_remote(remote_url, prompt, job_id, remote_params=[], outputs="final_image", node_inputs={},
+    queue_mode="replace", max_inflight=2, result_cache="disabled"):
+    """
+    Full dispatch used by the queue nodes - build the remote prompt, skip it
+    entirely on a result cache hit, otherwise queue it and start waiting for
+    the result in the background. Returns the remote_info for FetchRemote.
+    """
+    remote_prompt = build_remote_prompt(remote_url, prompt, remote_params, outputs, node_inputs)
+    remote_info = {
+        "remote_url" : remote_url,
+        "job_id"     : job_id,
+        "output_id"  : next((k for k, v in remote_prompt.items() if v.get("final_output")), None),
+        "outputs"    : {v["netdist_fetch"]: k for k, v in remote_prompt.items() if "netdist_fetch" in v},
+        "consumers"  : count_fetch_nodes(prompt, remote_prompt),
+    }
+    if result_cache == "enabled":
+        key = result_key(remote_prompt, get_model_names(remote_prompt))
+        remote_info["cache_key"] = key
+        job = RESULTS.get(key) # loaded now, the entry may be gone by the time it's fetched
+        if job is not None:
+            print(f"NetDist: result cache hit, skipping dispatch to '{remote_url}'")
+            start_fetch(remote_info, job)
+            return remote_info
+
+    prepare_remote_queue(remote_url, queue_mode, max_inflight)
+    remote_info["prompt_id"] = submit_prompt(remote_url, remote_prompt, job_id)
+    AFFINITY.record(remote_url, get_model_names(remote_prompt))
+    start_fetch(remote_info)
+    return remote_info
+
+WORKER_INPUTS = ( # RemoteQueueWorker settings and their defaults
+    ("remote_url", ""), ("batch_override", 0), ("enabled", "true"), ("outputs", "final_image"),
+    ("queue_mode", "replace"), ("max_inflight", 2), ("result_cache", "disabled"),
+)
+
+def worker_signature(inputs):
+    """Settings a worker was dispatched with, to tell if a pre-dispatched job is still current"""
+    return json.dumps([inputs.get(k, default) for k, default in WORKER_INPUTS])
+
+def get_chain_workers(prompt, start_id):
+    """
+    Workers of a remote chain that can be dispatched up front, in chain order.
+    Returns worker node id : inputs, for enabled workers whose settings
+    are plain values (linked ones have to wait for their own turn).
+    """
+    graph = PromptGraph(prompt)
+    workers = {}
+    todo = [start_id]
+    while todo:
+        current = todo.pop(0)
+        for i in sorted(graph.downstream_of.get(current, ())):
+            node = prompt[i]
+            if node["class_type"] != "RemoteQueueWorker" or node["inputs"].get("remote_chain") != [current, 0]:
+                continue
+            todo.append(i)
+            inputs = {k: v for k, v in node["inputs"].items() if k != "remote_chain"}
+            if inputs.get("enabled") == "true" and not any(is_link(x) for x in inputs.values()):
+                workers[i] = inputs
+    return workers
+
+def queue_chain(prompt, job_id, workers):
+    """
+    Dispatch all workers of a remote chain concurrently and wait for every
+    one of them. Returns worker node id : (worker_signature, remote_info).
+    """
+    def dispatch(inputs):
+        remote_url = pick_remote(clean_url(inputs["remote_url"], multi=True), prompt)
+        return queue_on_remote(
+            remote_url,
+            prompt,
+            job_id,
+            {},
+            inputs.get("outputs", "final_image"),
+            queue_mode   = inputs.get("queue_mode", "replace"),
+            max_inflight = inputs.get("max_inflight", 2),
+            result_cache = inputs.get("result_cache", "disabled"),
+        )
+
+    futures = {i: ENGINE.dispatch.submit(dispatch, x) for i, x in workers.items()}
+    return {i: (worker_signature(workers[i]), f.result()) for i, f in futures.items()}
@@ -0,0 +1,85 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+ENGINE_THREADS = 16 # concurrent remote jobs being waited on
+DISPATCH_THREADS = 8 # concurrent dispatches (prompt building, uploads, /prompt)
+DOWNLOAD_THREADS = 4 # parallel /view downloads per job
+ENGINE_TTL = 3600   # drop results nobody collected after this long
+ENGINE_KEEP = 16    # collected results kept around for nodes that re-run
+
+class IOEngine:
+	"""
+	Background thread pool for remote I/O.
+	Work is submitted under a key (usually remote URL + job ID) so that
+	the node consuming the result can pick up the matching future later.
+	Short dispatch work runs on its own executor, so it never queues up
+	behind the long running job waiters.
+	A result can be shared by several consumers. Once the last of them
+	popped it, it moves to a small LRU so a consumer that runs again
+	(changed settings on a fetch node) still finds it after the remote
+	history entry is gone.
+	"""
+	def __init__(self, max_workers=ENGINE_THREADS, ttl=ENGINE_TTL, keep=ENGINE_KEEP):
+		self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="netdist")
+		self.dispatch = ThreadPoolExecutor(max_workers=DISPATCH_THREADS, thread_name_prefix="netdist-dispatch")
+		self.ttl = ttl
+		self.futures = {} # key : [timestamp, future, consumers left]
+		self.keep = keep
+		self.done = OrderedDict() # key : future, fully consumed
+		self.lock = threading.Lock()
+
+	def submit(self, key, fn, *args, **kwargs):
+		return self.submit_shared(key, 1, fn, *args, **kwargs)
+
+	def submit_shared(self, key, consumers, fn, *args, **kwargs):
+		"""Submit work whose result is popped by more than one consumer"""
+		future = self.pool.submit(fn, *args, **kwargs)
+		with self.lock:
+			self.expire()
+			self.futures[key] = [time.time(), future, max(consumers, 1)]
+			self.done.pop(key, None)
+		return future
+
+	def put(self, key, consumers, result):
+		"""Register a result that's already available, e.g. from the result cache"""
+		future = Future()
+		future.set_result(result)
+		with self.lock:
+			self.expire()
+			self.futures[key] = [time.time(), future, max(consumers, 1)]
+			self.done.pop(key, None)
+		return future
+
+	def get(self, key):
+		with self.lock:
+			entry = self.futures.get(key)
+			return entry[1] if entry else self.done.get(key)
+
+	def pop(self, key):
+		with self.lock:
+			entry = self.futures.get(key)
+			if entry is None:
+				future = self.done.get(key)
+				if future is not None:
+					self.done.move_to_end(key)
+				return future
+			entry[2] -= 1
+			if entry[2] <= 0:
+				del self.futures[key]
+				self.done[key] = entry[1]
+				while len(self.done) > self.keep:
+					self.done.popitem(last=False)
+		return entry[1]
+
+	def expire(self):
+		cutoff = time.time() - self.ttl
+		stale = [k for k, (t, f, n) in self.futures.items() if t < cutoff and f.done()]
+		for k in stale:
+			del self.futures[k]
+
+ENGINE = IOEngine()
+
+def job_key(remote_url, job_id):
+	return f"{remote_url}|{job_id}"
@@ -0,0 +1,99 @@
+import time
+import json
+import threading
+from queue import Queue
+
+try:
+	import websocket # websocket-client
+except ImportError:
+	websocket = None
+
+from .utils import get_client_id
+
+RECONNECT = 2 # seconds between websocket reconnect attempts
+DONE_EVENTS = ["execution_success", "execution_error", "execution_interrupted"]
+
+class RemoteEvents:
+	"""
+	Background listener for a remote's /ws stream.
+	The remote only sends us messages for prompts queued with our client_id.
+	Waiters grab the current sequence number, check the remote, then sleep
+	until the sequence changes (i.e. a prompt finished) or they time out.
+	Streaming consumers can also subscribe to the messages of one prompt.
+	"""
+	def __init__(self, remote_url):
+		scheme, rest = remote_url.split("://", 1)
+		scheme = "wss" if scheme == "https" else "ws"
+		self.url = f"{scheme}://{rest}/ws?clientId={get_client_id()}"
+		self.connected = False
+		self.seq = 0
+		self.cond = threading.Condition()
+		self.subscribers = {} # prompt_id : Queue of (kind, data)
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def run(self):
+		while True:
+			try:
+				ws = websocket.create_connection(self.url, timeout=4)
+				ws.settimeout(None)
+				self.set_connected(True)
+				while True:
+					msg = ws.recv()
+					if type(msg) != str:
+						continue # binary preview images
+					self.handle(json.loads(msg))
+			except Exception as e:
+				if self.connected:
+					print(f"NetDist: lost websocket connection to '{self.url}'\n", e)
+				self.set_connected(False)
+				time.sleep(RECONNECT)
+
+	def set_connected(self, state):
+		with self.cond:
+			self.connected = state
+			self.seq += 1 # make waiters re-check after (re)connecting
+			self.cond.notify_all()
+
+	def handle(self, msg):
+		kind = msg.get("type")
+		data = msg.get("data") or {}
+		done = kind in DONE_EVENTS
+		done |= kind == "executing" and data.get("node") is None
+		with self.cond:
+			queue = self.subscribers.get(data.get("prompt_id"))
+			if done:
+				self.seq += 1
+				self.cond.notify_all()
+		if queue is not None:
+			queue.put(("done" if done else kind, data))
+
+	def subscribe(self, prompt_id):
+		"""Queue receiving (kind, data) for every message of a prompt, kind is 'done' once it finished"""
+		queue = Queue()
+		with self.cond:
+			self.subscribers[prompt_id] = queue
+		return queue
+
+	def unsubscribe(self, prompt_id):
+		with self.cond:
+			self.subscribers.pop(prompt_id, None)
+
+	def wait(self, seq, timeout):
+		"""Block until something happened after 'seq', returns False on timeout"""
+		with self.cond:
+			return self.cond.wait_for(lambda: self.seq != seq, timeout)
+
+EVENTS = {}
+EVENTS_LOCK = threading.Lock()
+
+def get_events(remote_url):
+	"""Shared listener for a remote, None if websocket-client is missing"""
+	if websocket is None:
+		return None
+	with EVENTS_LOCK:
+		events = EVENTS.get(remote_url)
+		if events is None:
+			events = RemoteEvents(remote_url)
+			EVENTS[remote_url] = events
+	return events
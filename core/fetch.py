@@ -1,97 +1,219 @@
 import time
 import json
 import torch
-import requests
 import numpy as np
 from PIL import Image
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-POLLING = 0.5
+try:
+	import comfy.utils as comfy_utils # progress bar, only inside ComfyUI
+except ImportError:
+	comfy_utils = None
 
-def get_job_output(inputs, outputs):
-	output_id = list(outputs.keys())[-1] # fallback to last
-	for i,d in inputs.items():
-		if d.get("final_output") and i in outputs.keys():
-			output_id = i
-			break
-	return outputs[output_id].get("images", [])
+from .client import get_client
+from .engine import ENGINE, job_key
+from .stream import stream_job, POLLING, POLLING_FALLBACK, DOWNLOAD_THREADS, EXTRAS_KEY
+from .codec import merge_image_info, to_base64, decode_latent, decode_tensors, is_codec
+from .cache import RESULTS
 
-def wait_for_job(remote_url, job_id):
-	fail = 0
-	while fail <= 3:
-		r = requests.get(f"{remote_url}/history", timeout=4)
+PROGRESS_INTERVAL = 0.25 # seconds between progress bar updates while waiting
+PROGRESS = {} # job_key : (value, max) of the remote sampler, set by download_job
+
+def wait_for_update(events, seq):
+	if events and events.connected:
+		events.wait(seq, POLLING_FALLBACK)
+	else:
+		time.sleep(POLLING)
+
+def delete_history(remote_url, prompt_id):
+	"""Drop our finished job from the remote history to keep it small"""
+	if not prompt_id:
+		return
+	r = get_client(remote_url).post("/history", json={"delete": [prompt_id]})
+	try:
+		r.raise_for_status()
+	except Exception as e:
+		print("NetDist caught error while clearing remote history:\n", e)
+
+def decode_images(blobs):
+	"""
+	Decode downloaded images concurrently, keeps order.
+	Encoded files turn into PIL images, raw netdist ones into uint8 arrays.
+	"""
+	def decode(data):
+		if is_codec(data):
+			return decode_tensors(data)[0]["image"].numpy()
+		img = Image.open(BytesIO(data))
+		img.load()
+		return img
+
+	if len(blobs) == 0:
+		return []
+	start = time.time()
+	with ThreadPoolExecutor(max_workers=min(DOWNLOAD_THREADS, len(blobs))) as pool:
+		images = list(pool.map(decode, blobs))
+	print(f"NetDist: decoded {len(images)} image(s) in {time.time()-start:.3f}s")
+	return images
+
+def image_info(images):
+	"""PNG text chunks of decoded images, raw images have none"""
+	return [getattr(x, "info", {}) for x in images]
+
+def images_to_torch(images):
+	"""Convert decoded images into a single preallocated [B,H,W,3] float batch"""
+	def pixels(img):
+		return img if isinstance(img, np.ndarray) else np.asarray(img.convert("RGB"))
+
+	h, w = pixels(images[0]).shape[:2]
+	out = torch.empty((len(images), h, w, 3), dtype=torch.float32)
+	buf = out.numpy() # shares memory with out
+	for k, img in enumerate(images):
+		np.divide(pixels(img), np.float32(255.0), out=buf[k])
+	return out
+
+def download_job(remote_url, job_id, prompt_id=None, cache_key=None, output_ids=None):
+	"""
+	Download the images and any sidecars of a job as the remote reports them.
+	Images are kept as encoded bytes so consumers only decode what they use.
+	The job is {"outputs": {node: [bytes]}, "images": [bytes], "extras": {kind: bytes}}
+	where images are the ones of the first (final) output node.
+	"""
+	key = job_key(remote_url, job_id)
+	def progress(value, total, node):
+		PROGRESS[key] = (value, total)
+
+	job = {"outputs": {}, "extras": {}}
+	try:
+		for node, kind, info, data in stream_job(remote_url, job_id, prompt_id, output_ids, progress):
+			if kind == EXTRAS_KEY:
+				job["extras"][info["kind"]] = data
+			else:
+				job["outputs"].setdefault(node, []).append(data)
+	finally:
+		PROGRESS.pop(key, None)
+	primary = output_ids[0] if output_ids else next(iter(job["outputs"]), None)
+	job["images"] = job["outputs"].get(primary, [])
+	delete_history(remote_url, prompt_id)
+	if cache_key and job["images"]:
 		try:
-			r.raise_for_status()
-		except Exception as e:
-			print("NetDist caught error while fetching output image:\n", e)
-			fail += 1
-			continue
-		data = r.json()
-		if not data:
-			time.sleep(POLLING)
+			RESULTS.put(cache_key, job)
+		except OSError as e:
+			print(f"NetDist: failed to store result in cache '{cache_key}'\n", e)
+	return job
+
+def start_fetch(remote_info, job=None):
+	"""
+	Wait for a dispatched job in the background, collected by fetch_job.
+	Every fetch node reading from the job gets its own output in one download.
+	A job that's already available (result cache hit) is handed over as is.
+	"""
+	key = job_key(remote_info["remote_url"], remote_info["job_id"])
+	outputs = remote_info.get("outputs", {}) # fetch node : remote output node
+	consumers = remote_info.get("consumers", len(outputs)) # every fetch node pops the result
+	if job is not None:
+		ENGINE.put(key, consumers, job)
+		return
+	output_ids = list(dict.fromkeys(outputs.values()))
+	if not output_ids and remote_info.get("output_id"):
+		output_ids = [remote_info["output_id"]]
+	ENGINE.submit_shared(
+		key,
+		consumers,
+		download_job,
+		remote_info["remote_url"],
+		remote_info["job_id"],
+		remote_info.get("prompt_id"),
+		remote_info.get("cache_key"),
+		output_ids,
+	)
+
+def wait_with_progress(key, future):
+	"""Wait for a background fetch, mirroring the remote sampler progress on the current node"""
+	pbar = None
+	while True:
+		try:
+			return future.result(timeout=PROGRESS_INTERVAL)
+		except FutureTimeout:
+			pass
+		value, total = PROGRESS.get(key, (0, 0))
+		if comfy_utils is None or total <= 0:
 			continue
-		for i,d in data.items():
-			if d["prompt"][3].get("job_id") == job_id:
-				# this needs to be less jank
-				if len(d["outputs"].keys()) > 0:
-					return get_job_output(d["prompt"][2], d["outputs"])
-				else:
-					return []
-		# todo: check if it's actually in the queue to avoid waiting forever
-		time.sleep(POLLING)
-	raise OSError("Failed to fetch image from remote client!")
+		if pbar is None or pbar.total != total:
+			pbar = comfy_utils.ProgressBar(total)
+		pbar.update_absolute(value, total)
 
-def fetch_from_remote(remote_url, job_id):
-	def img_to_torch(img):
-		image = img.convert("RGB")
-		image = np.array(image).astype(np.float32) / 255.0
-		image_tensor = torch.from_numpy(image)[None,]
-		image_tensor.metadata = img.info  # Store metadata in tensor attribute
-		return image_tensor
+def fetch_job(remote_url, job_id, prompt_id=None, cache_key=None):
+	key = job_key(remote_url, job_id)
+	future = ENGINE.pop(key)
+	if future is not None:
+		return wait_with_progress(key, future)
+	if cache_key:
+		job = RESULTS.get(cache_key)
+		if job is not None:
+			return job
+	return download_job(remote_url, job_id, prompt_id, cache_key)
 
+def job_output(job, output_id=None):
+	"""Files of one output node of a job, the final output by default"""
+	if output_id and output_id in job["outputs"]:
+		return job["outputs"][output_id]
+	return job["images"]
+
+def fetch_from_remote(remote_url, job_id, prompt_id=None, cache_key=None, output_id=None):
 	if not remote_url or not job_id:
 		return None
 
-	images = []
-	for i in wait_for_job(remote_url, job_id):
-		img_url = f"{remote_url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
-
-		ir = requests.get(img_url, stream=True, timeout=16)
-		ir.raise_for_status()
-		img = Image.open(ir.raw)
-		images.append(img_to_torch(img))
-
+	images = decode_images(job_output(fetch_job(remote_url, job_id, prompt_id, cache_key), output_id))
 	if len(images) == 0:
 		return None
 
-	out = images[0]
-	for i in images[1:]:
-		out = torch.cat((out, i))
+	out = images_to_torch(images)
+	out.metadata = merge_image_info(image_info(images))  # Store metadata in tensor attribute
 	return out
 
 #with extras returns both the output and the metadata from the images generated remotely
-def fetch_from_remote_with_extras(remote_url, job_id):
-	def img_to_torch(img):
-		image = img.convert("RGB")
-		image = np.array(image).astype(np.float32) / 255.0
-		image_tensor = torch.from_numpy(image)[None,]
-		return image_tensor
-
+def fetch_from_remote_with_extras(remote_url, job_id, prompt_id=None, cache_key=None, decode=True):
 	if not remote_url or not job_id:
-		return None
+		return None, {}
 
-	images = []
-	for i in wait_for_job(remote_url, job_id):
-		img_url = f"{remote_url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
-
-		ir = requests.get(img_url, stream=True, timeout=16)
-		ir.raise_for_status()
-		img = Image.open(ir.raw)
-		images.append(img_to_torch(img))
+	job = fetch_job(remote_url, job_id, prompt_id, cache_key)
+	# sidecars are already raw netdist payloads, no need to touch the PNGs
+	extras = {k: to_base64(v) for k, v in job["extras"].items()}
+	if extras and not decode:
+		return None, extras
 
+	images = decode_images(job["images"])
 	if len(images) == 0:
+		return None, extras
+
+	info = merge_image_info(image_info(images))
+	info.update(extras)
+	return images_to_torch(images), info
+
+def fetch_latent_from_remote(remote_info, fetch_id=None):
+	"""Raw latent output of one job or a pool of jobs, None if there is none"""
+	jobs = remote_info.get("jobs", [remote_info])
+	blobs = []
+	for job in jobs:
+		if not job.get("remote_url") or not job.get("job_id"):
+			continue
+		data = fetch_job(job["remote_url"], job["job_id"], job.get("prompt_id"), job.get("cache_key"))
+		blobs += job_output(data, job.get("outputs", {}).get(fetch_id))
+	if len(blobs) == 0:
 		return None
+	latents = [decode_latent(x) for x in blobs]
+	out = latents[0]
+	if len(latents) > 1:
+		out = {"samples": torch.cat([x["samples"] for x in latents])}
+	return out
 
-	out = images[0]
-	for i in images[1:]:
-		out = torch.cat((out, i))
-	return out, img.info
\ No newline at end of file
+def fetch_from_pool(jobs, fetch_id=None):
+	"""Merge the outputs of a job split across several remotes, in order"""
+	blobs = []
+	for job in jobs:
+		data = fetch_job(job["remote_url"], job["job_id"], job.get("prompt_id"), job.get("cache_key"))
+		blobs += job_output(data, job.get("outputs", {}).get(fetch_id))
+	if len(blobs) == 0:
+		return None
+	return images_to_torch(decode_images(blobs))
@@ -0,0 +1,47 @@
+from collections import deque
+
+def is_link(value):
+	"""API prompt links are [node_id, output_slot]"""
+	return type(value) == list and len(value) == 2 and type(value[0]) == str
+
+class PromptGraph:
+	"""
+	Index over an API format prompt.
+	Forward/reverse adjacency is built once so graph queries
+	don't have to rescan every node's inputs.
+	"""
+	def __init__(self, prompt):
+		self.prompt = prompt
+		self.upstream_of = {}   # node : set of nodes it reads from
+		self.downstream_of = {} # node : set of nodes reading from it
+		self.classes = {}       # class_type : [node, ...]
+		for node, data in prompt.items():
+			self.downstream_of.setdefault(node, set())
+			self.classes.setdefault(data.get("class_type"), []).append(node)
+			src = set()
+			for value in data.get("inputs", {}).values():
+				if is_link(value):
+					src.add(value[0])
+					self.downstream_of.setdefault(value[0], set()).add(node)
+			self.upstream_of[node] = src
+
+	def _closure(self, start_nodes, edges):
+		seen = set(start_nodes)
+		todo = deque(seen)
+		while todo:
+			for node in edges.get(todo.popleft(), ()):
+				if node not in seen:
+					seen.add(node)
+					todo.append(node)
+		return seen
+
+	def downstream(self, start_nodes):
+		"""All nodes depending on any of the start nodes (inclusive)"""
+		return self._closure(start_nodes, self.downstream_of)
+
+	def upstream(self, start_nodes):
+		"""All nodes any of the start nodes depend on (inclusive)"""
+		return self._closure(start_nodes, self.upstream_of)
+
+	def nodes_of_class(self, *class_types):
+		return [n for c in class_types for n in self.classes.get(c, [])]
@@ -0,0 +1,37 @@
+class PromptOverlay(dict):
+	"""
+	Copy-on-write view of an API format prompt.
+	Node dicts are shared with the base prompt until one of their inputs is
+	changed through set_input/edit, at which point only that node (and its
+	inputs dict, not the values) is copied. Since this is a plain dict of
+	nodes it serializes with json.dumps directly. The base is never modified,
+	so don't write to nodes without going through edit first.
+	"""
+	def __init__(self, base={}):
+		super().__init__(base)
+		self.edited = set() # nodes copied from the base
+
+	def edit(self, node_id):
+		"""Writable version of a node"""
+		if node_id not in self.edited:
+			node = dict(self[node_id])
+			node["inputs"] = dict(node.get("inputs", {}))
+			self[node_id] = node
+			self.edited.add(node_id)
+		return self[node_id]
+
+	def set_input(self, node_id, key, value):
+		self.edit(node_id)["inputs"][key] = value
+
+	def update_inputs(self, node_id, values):
+		if values:
+			self.edit(node_id)["inputs"].update(values)
+
+	def __setitem__(self, node_id, node):
+		# nodes added from outside are owned by the overlay
+		super().__setitem__(node_id, node)
+		self.edited.add(node_id)
+
+	def __delitem__(self, node_id):
+		super().__delitem__(node_id)
+		self.edited.discard(node_id)
@@ -0,0 +1,84 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+PATCH_CACHE_SIZE = 64 # compiled tables kept, one per workflow structure/patch set
+
+def structure_hash(prompt):
+	"""Hash of the node IDs, classes and input names - not the input values"""
+	data = [(k, v.get("class_type"), sorted(v.get("inputs", {}).keys())) for k, v in prompt.items()]
+	return hashlib.sha1(json.dumps(data, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+class PatchIndex:
+	"""Input names of each node, plus the first node that has a given input"""
+	def __init__(self, prompt):
+		self.inputs = {} # node : set of input names
+		self.first = {}  # input name : first node in prompt order having it
+		for node, data in prompt.items():
+			names = data.get("inputs", {}).keys()
+			self.inputs[node] = set(names)
+			for name in names:
+				self.first.setdefault(name, node)
+
+	def resolve(self, nodeid, param, default=None):
+		"""
+		Node a (nodeid, param) patch applies to, None if there is none.
+		Without a node ID the default node is tried first, then the first
+		node in the prompt that has an input with that name.
+		"""
+		if nodeid:
+			return nodeid if param in self.inputs.get(nodeid, ()) else None
+		if default is not None and param in self.inputs.get(default, ()):
+			return default
+		return self.first.get(param)
+
+class PatchCompiler:
+	"""
+	Compile parameter patches into a direct (nodeid, param) -> node table.
+	Tables are cached per workflow structure, default node and set of
+	targets, so repeated dispatches only pay for the assignments.
+	"""
+	def __init__(self, size=PATCH_CACHE_SIZE):
+		self.size = size
+		self.tables = OrderedDict() # key : (table, unresolved)
+		self.lock = threading.Lock()
+
+	def compile(self, prompt, targets, default=None, struct=None):
+		key = (struct or structure_hash(prompt), default, tuple(targets))
+		with self.lock:
+			cached = self.tables.get(key)
+			if cached is not None:
+				self.tables.move_to_end(key)
+				return cached
+		index = PatchIndex(prompt)
+		table, unresolved = {}, []
+		for nodeid, param in targets:
+			node = index.resolve(nodeid, param, default)
+			if node is None:
+				unresolved.append((nodeid, param))
+			else:
+				table[(nodeid, param)] = node
+		with self.lock:
+			self.tables[key] = (table, unresolved)
+			while len(self.tables) > self.size:
+				self.tables.popitem(last=False)
+		return table, unresolved
+
+PATCHES = PatchCompiler()
+
+def apply_patches(prompt, patches, default=None, struct=None):
+	"""
+	Apply {(nodeid, param): value} to a PromptOverlay in one pass.
+	Targets that don't match any node are reported together and returned.
+	struct can be passed by callers that already hashed the prompt structure.
+	"""
+	if not patches:
+		return []
+	table, unresolved = PATCHES.compile(prompt, list(patches.keys()), default, struct)
+	for target, node in table.items():
+		prompt.set_input(node, target[1], patches[target])
+	if unresolved:
+		names = ", ".join(f"{nodeid or '*'}.{param}" for nodeid, param in unresolved)
+		print(f"NetDist: {len(unresolved)} remote param(s) not found in the workflow: {names}")
+	return unresolved
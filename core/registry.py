@@ -0,0 +1,129 @@
+import os
+import time
+import json
+import tempfile
+import threading
+
+from .client import get_client
+
+REGISTRY_TTL = 300 # seconds before cached metadata is refreshed
+STATS_TTL = 5      # VRAM changes constantly, refresh more often if asked for
+
+class CapabilityRegistry:
+	"""
+	Cache of remote metadata, keyed by remote URL.
+	Each remote has a few sections (system_stats, object_info, models/<folder>)
+	which are fetched on first use and refreshed once they're older than the TTL.
+	Only the parts we actually use are kept, not the raw multi-MB object_info.
+	"""
+	def __init__(self, ttl=REGISTRY_TTL, snapshot=None):
+		self.ttl = ttl
+		self.snapshot = snapshot # optional JSON file to persist across restarts
+		self.data = {} # remote_url : { section : (timestamp, value) }
+		self.lock = threading.Lock()
+		self.snapshot_lock = threading.Lock() # one snapshot writer at a time
+		if snapshot and os.path.isfile(snapshot):
+			self.load_snapshot(snapshot)
+
+	def _get(self, remote_url, section, fetch, max_age=None):
+		max_age = self.ttl if max_age is None else max_age
+		with self.lock:
+			cached = self.data.get(remote_url, {}).get(section)
+		if cached and (time.time() - cached[0]) < max_age:
+			return cached[1]
+		value = fetch(remote_url)
+		with self.lock:
+			self.data.setdefault(remote_url, {})[section] = (time.time(), value)
+		# short lived refreshes (VRAM every few seconds) aren't worth persisting
+		if self.snapshot and max_age >= self.ttl:
+			self.save_snapshot(self.snapshot)
+		return value
+
+	def _fetch_stats(self, remote_url):
+		r = get_client(remote_url).get("/system_stats")
+		r.raise_for_status()
+		data = r.json()
+		return {
+			"os": data["system"]["os"],
+			"devices": [{
+				"name"       : x.get("name"),
+				"vram_total" : x.get("vram_total", 0),
+				"vram_free"  : x.get("vram_free", 0),
+			} for x in data.get("devices", [])],
+		}
+
+	def _fetch_object_info(self, remote_url):
+		r = get_client(remote_url).get("/object_info", timeout=16)
+		r.raise_for_status()
+		data = r.json()
+		return {
+			"node_classes" : sorted(data.keys()),
+			"output_nodes" : sorted(k for k, v in data.items() if v.get("output_node")),
+		}
+
+	def _fetch_models(self, folder):
+		def fetch(remote_url):
+			r = get_client(remote_url).get(f"/models/{folder}")
+			r.raise_for_status()
+			return r.json()
+		return fetch
+
+	def get_stats(self, remote_url, max_age=None):
+		return self._get(remote_url, "system_stats", self._fetch_stats, max_age)
+
+	def get_os(self, remote_url):
+		# OS never changes, so any cached copy is fine
+		return self.get_stats(remote_url, max_age=float("inf"))["os"]
+
+	def get_vram(self, remote_url, max_age=STATS_TTL):
+		"""Free and total VRAM summed over all devices"""
+		devices = self.get_stats(remote_url, max_age)["devices"]
+		return (
+			sum(x["vram_free"] for x in devices),
+			sum(x["vram_total"] for x in devices),
+		)
+
+	def get_node_classes(self, remote_url):
+		return self._get(remote_url, "object_info", self._fetch_object_info)["node_classes"]
+
+	def get_output_nodes(self, remote_url):
+		return self._get(remote_url, "object_info", self._fetch_object_info)["output_nodes"]
+
+	def get_models(self, remote_url, folder):
+		return self._get(remote_url, f"models/{folder}", self._fetch_models(folder))
+
+	def invalidate(self, remote_url=None):
+		with self.lock:
+			if remote_url is None:
+				self.data.clear()
+			else:
+				self.data.pop(remote_url, None)
+
+	def save_snapshot(self, path):
+		with self.snapshot_lock:
+			with self.lock:
+				data = json.dumps(self.data)
+			tmp = None
+			try:
+				fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+				with os.fdopen(fd, "w") as f:
+					f.write(data)
+				os.replace(tmp, path)
+			except OSError as e:
+				print(f"NetDist: Failed to save remote registry snapshot '{path}'\n", e)
+				if tmp and os.path.exists(tmp):
+					os.remove(tmp)
+
+	def load_snapshot(self, path):
+		try:
+			with open(path) as f:
+				data = json.loads(f.read())
+		except (OSError, ValueError) as e:
+			print(f"NetDist: Failed to load remote registry snapshot '{path}'\n", e)
+			return
+		with self.lock:
+			for remote_url, sections in data.items():
+				self.data[remote_url] = {k: tuple(v) for k, v in sections.items()}
+
+# set NETDIST_REGISTRY_SNAPSHOT to a file to keep remote metadata across restarts
+REGISTRY = CapabilityRegistry(snapshot=os.environ.get("NETDIST_REGISTRY_SNAPSHOT") or None)
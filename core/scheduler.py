@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import get_client
+from .registry import REGISTRY
+from .affinity import AFFINITY, get_model_names
+
+DEFAULT_LATENCY = 10.0 # seconds per job assumed for remotes we haven't timed yet
+LATENCY_ALPHA = 0.3    # weight of the newest sample in the moving average
+VRAM_WEIGHT = 0.5      # max slowdown factor applied to a remote with no free VRAM
+
+class RemoteScheduler:
+	"""
+	Pick the remote that should finish a new job first.
+	The estimate is (pending jobs + 1) * average job time plus the time
+	needed to swap in models the remote didn't run last, scaled up for
+	remotes that are low on free VRAM. Remotes that don't respond are skipped.
+	"""
+	def __init__(self):
+		self.latency = {} # remote_url : moving average of seconds per job
+		self.lock = threading.Lock()
+
+	def record_latency(self, remote_url, seconds):
+		with self.lock:
+			old = self.latency.get(remote_url)
+			if old is None:
+				self.latency[remote_url] = seconds
+			else:
+				self.latency[remote_url] = old + LATENCY_ALPHA * (seconds - old)
+
+	def record_history(self, remote_url, entry):
+		"""Time a finished job from the timestamps in its history entry"""
+		stamps = {}
+		for name, data in entry.get("status", {}).get("messages", []):
+			if type(data) == dict and "timestamp" in data:
+				stamps[name] = data["timestamp"]
+		if "execution_start" in stamps and "execution_success" in stamps:
+			seconds = (stamps["execution_success"] - stamps["execution_start"]) / 1000.0
+			self.record_latency(remote_url, max(seconds, 0.0))
+
+	def get_latency(self, remote_url):
+		with self.lock:
+			return self.latency.get(remote_url, DEFAULT_LATENCY)
+
+	def queue_depth(self, remote_url):
+		r = get_client(remote_url).get("/queue")
+		r.raise_for_status()
+		queue = r.json()
+		return len(queue.get("queue_pending", [])) + len(queue.get("queue_running", []))
+
+	def score(self, remote_url, models=[]):
+		try:
+			depth = self.queue_depth(remote_url)
+		except Exception as e:
+			print(f"NetDist: skipping unreachable remote '{remote_url}'\n", e)
+			return float("inf")
+		score = (depth + 1) * self.get_latency(remote_url)
+		score += AFFINITY.penalty(remote_url, models)
+		try:
+			free, total = REGISTRY.get_vram(remote_url)
+		except Exception:
+			free, total = 0, 0
+		if total > 0:
+			score *= 1.0 + VRAM_WEIGHT * (1.0 - free / total)
+		return score
+
+	def scores(self, remote_urls, models=[]):
+		with ThreadPoolExecutor(max_workers=len(remote_urls)) as pool:
+			return dict(zip(remote_urls, pool.map(lambda x: self.score(x, models), remote_urls)))
+
+	def pick(self, remote_urls, models=[]):
+		if len(remote_urls) == 1:
+			return remote_urls[0]
+		scores = self.scores(remote_urls, models)
+		best = min(remote_urls, key=lambda x: scores[x])
+		if scores[best] == float("inf"):
+			return remote_urls[0] # let dispatch raise the actual error
+		return best
+
+SCHEDULER = RemoteScheduler()
+
+def pick_remote(remote_urls, prompt=None):
+	"""Best remote for a job, preferring ones that already have its models loaded"""
+	models = get_model_names(prompt) if prompt else []
+	return SCHEDULER.pick(remote_urls, models)
@@ -0,0 +1,165 @@
+import time
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import get_client
+from .events import get_events
+from .engine import DOWNLOAD_THREADS
+from .scheduler import SCHEDULER
+
+POLLING = 0.5          # poll interval without a websocket connection
+POLLING_FALLBACK = 5.0 # safety net poll interval while connected
+JOB_TIMEOUT = 3600     # give up on a job that didn't finish after this long
+ALL_OUTPUTS = "*"      # stream the images of every output node
+OUTPUT_KEYS = ( # ui keys of the remote output nodes we substitute
+	"images",         # PreviewImage
+	"netdist_images", # PreviewImageNetDist (webp/raw)
+	"latents",        # PreviewLatentNetDist
+)
+EXTRAS_KEY = "netdist_extras" # sidecars written by SaveImageWithBase64
+
+def download_files(remote_url, files):
+	"""Download files from the remote concurrently, keeps order"""
+	client = get_client(remote_url)
+	def download(i):
+		ir = client.view(i['filename'], i['subfolder'], i['type'], stream=False)
+		ir.raise_for_status()
+		return ir.content
+
+	if len(files) == 0:
+		return []
+	with ThreadPoolExecutor(max_workers=min(DOWNLOAD_THREADS, len(files))) as pool:
+		return list(pool.map(download, files))
+
+def get_history_entry(remote_url, job_id, prompt_id=None):
+	"""History entry of a finished job, None while it's still queued/running"""
+	path = f"/history/{prompt_id}" if prompt_id else "/history"
+	r = get_client(remote_url).get(path)
+	r.raise_for_status()
+	for i,d in r.json().items():
+		if i == prompt_id or d["prompt"][3].get("job_id") == job_id:
+			return d
+	return None
+
+def job_queued(remote_url, job_id, prompt_id=None):
+	"""True while the job is still pending or running on the remote"""
+	r = get_client(remote_url).get("/queue")
+	r.raise_for_status()
+	data = r.json()
+	for d in data.get("queue_running", []) + data.get("queue_pending", []):
+		if d[1] == prompt_id or (len(d) > 3 and d[3].get("job_id") == job_id):
+			return True
+	return False
+
+def final_output_id(entry):
+	"""Node marked as final_output by dispatch, falls back to the last output"""
+	outputs = entry["outputs"]
+	for i,d in entry["prompt"][2].items():
+		if d.get("final_output") and i in outputs.keys():
+			return i
+	return list(outputs.keys())[-1] if outputs else None
+
+def output_files(node, output, output_ids):
+	"""(key, file) pairs an output node reported that we're interested in"""
+	files = [(EXTRAS_KEY, x) for x in output.get(EXTRAS_KEY, [])]
+	if output_ids == ALL_OUTPUTS or node in output_ids:
+		for key in OUTPUT_KEYS:
+			if output.get(key):
+				files += [(key, x) for x in output[key]]
+				break
+	return files
+
+def stream_job(remote_url, job_id, prompt_id=None, output_ids=None, progress=None, timeout=JOB_TIMEOUT):
+	"""
+	Yield (node, key, file, data) for each output file of a job as soon as the
+	remote reports it. node is the output node, key the ui key it was reported
+	under, file the {filename, subfolder, type} dict and data the downloaded bytes.
+	Files are picked up from "executed" websocket messages when output_ids are
+	known (a list of node ids or ALL_OUTPUTS). Anything missed, or everything
+	without a websocket/output_ids, is taken from the history entry once the
+	job is done, in which case only the final output node is used.
+	progress(value, max, node) is called for the sampler progress events.
+	Raises OSError once the job is gone from the remote or after timeout seconds.
+	"""
+	events = get_events(remote_url)
+	messages = events.subscribe(prompt_id) if events and prompt_id else None
+	seen = set()
+
+	def new_files(node, pairs):
+		out = []
+		for key, x in pairs:
+			ident = (x["filename"], x["subfolder"], x["type"])
+			if ident not in seen:
+				seen.add(ident)
+				out.append((node, key, x))
+		return out
+
+	def fetch(pairs):
+		start = time.time()
+		blobs = download_files(remote_url, [x for _, _, x in pairs])
+		if blobs:
+			size = sum(len(x) for x in blobs)
+			print(f"NetDist: downloaded {len(blobs)} file(s), {size/1024:.0f}KiB from '{remote_url}' in {time.time()-start:.3f}s")
+		return [(node, key, x, data) for (node, key, x), data in zip(pairs, blobs)]
+
+	def missing():
+		# neither finished nor queued means the job was dropped (replace
+		# mode, remote restart) or its history entry was already deleted
+		if job_queued(remote_url, job_id, prompt_id):
+			return False
+		return get_history_entry(remote_url, job_id, prompt_id) is None
+
+	try:
+		fail = 0
+		started = time.time()
+		checked = 0 # last /queue check
+		waiting = False # jobs that finish quickly are already in the history
+		while True:
+			if not waiting:
+				waiting = True
+			elif messages is not None and events.connected:
+				try:
+					kind, data = messages.get(timeout=POLLING_FALLBACK)
+				except Empty:
+					kind, data = None, {}
+				if kind == "progress" and progress:
+					progress(data.get("value", 0), data.get("max", 0), data.get("node"))
+				if kind == "executed" and output_ids:
+					node = data.get("node")
+					yield from fetch(new_files(node, output_files(node, data.get("output") or {}, output_ids)))
+				if kind is not None and kind != "done":
+					continue
+			elif messages is None:
+				time.sleep(POLLING)
+
+			try:
+				entry = get_history_entry(remote_url, job_id, prompt_id)
+				gone = False
+				if entry is None and time.time() - checked >= POLLING_FALLBACK:
+					checked = time.time()
+					gone = missing()
+			except Exception as e:
+				print("NetDist caught error while fetching output image:\n", e)
+				fail += 1
+				if fail > 3:
+					raise OSError("Failed to fetch image from remote client!")
+				continue
+			if gone:
+				raise OSError(f"Job '{job_id}' is no longer queued or in the history of '{remote_url}'")
+			if entry is None:
+				if time.time() - started > timeout:
+					raise OSError(f"Timed out waiting for job '{job_id}' on '{remote_url}'")
+				if messages is not None and not events.connected:
+					time.sleep(POLLING)
+				continue
+
+			SCHEDULER.record_history(remote_url, entry)
+			targets = output_ids if output_ids else [final_output_id(entry)]
+			pairs = []
+			for node, output in entry["outputs"].items():
+				pairs += new_files(node, output_files(node, output, targets))
+			yield from fetch(pairs)
+			return
+	finally:
+		if messages is not None:
+			events.unsubscribe(prompt_id)
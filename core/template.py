@@ -0,0 +1,60 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .graph import is_link
+
+TEMPLATE_CACHE_SIZE = 32 # remote prompt templates kept
+FETCH_SETTINGS = ("wire_format", "quality", "precision") # fetch node inputs that end up in the remote prompt
+
+def template_key(remote_url, prompt, outputs="final_image", node_inputs={}):
+	"""
+	Hash of everything the remote prompt layout depends on: node IDs,
+	classes, links and input names, plus the few values that control it
+	(queue node URLs, fetch node settings). Other input values are free
+	to change without invalidating the template.
+	"""
+	data = [remote_url, outputs, sorted(node_inputs.keys())]
+	for node, d in prompt.items():
+		class_type = d.get("class_type", "")
+		inputs = d.get("inputs", {})
+		if class_type.startswith("RemoteQueue"):
+			control = inputs.get("remote_url")
+		elif class_type.startswith("FetchRemote"):
+			control = {k: inputs[k] for k in FETCH_SETTINGS if k in inputs}
+		else:
+			control = None
+		links = {k: (v if is_link(v) else None) for k, v in inputs.items()}
+		data.append((node, class_type, links, control))
+	data = json.dumps(data, sort_keys=True, separators=(",", ":"))
+	return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+class TemplateCache:
+	"""
+	LRU of remote prompt templates, keyed by template_key.
+	A template describes how a host prompt turns into the remote prompt
+	(enabled flags, pruned nodes, added output nodes, nodes with inputs that
+	need uploading/path translation) so only the values have to be applied
+	per dispatch.
+	"""
+	def __init__(self, size=TEMPLATE_CACHE_SIZE):
+		self.size = size
+		self.data = OrderedDict() # key : template
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			template = self.data.get(key)
+			if template is not None:
+				self.data.move_to_end(key)
+			return template
+
+	def put(self, key, template):
+		with self.lock:
+			self.data[key] = template
+			self.data.move_to_end(key)
+			while len(self.data) > self.size:
+				self.data.popitem(last=False)
+
+TEMPLATES = TemplateCache()
@@ -0,0 +1,97 @@
+import os
+import hashlib
+import threading
+
+from .client import get_client
+
+UPLOAD_NODES = { # class type : input with a file from the local input folder
+	"LoadImage"     : "image",
+	"LoadImageMask" : "image",
+}
+UPLOAD_SUBFOLDER = "netdist"
+
+def local_input_path(name):
+	"""Resolve a LoadImage value to a local file, None if we can't find it"""
+	try:
+		import folder_paths # only available when running inside ComfyUI
+	except ImportError:
+		return None
+	path = folder_paths.get_annotated_filepath(name)
+	return path if os.path.isfile(path) else None
+
+class UploadIndex:
+	"""
+	Upload local input images to remotes, at most once per file content.
+	Files are stored under a content hash prefixed name, so the remote
+	copy is immutable and an index of hashes per remote is enough to
+	know what is already there. Hashes are cached by path/size/mtime.
+	"""
+	def __init__(self, subfolder=UPLOAD_SUBFOLDER):
+		self.subfolder = subfolder
+		self.hashes = {} # path : ((size, mtime), sha256)
+		self.remote = {} # remote_url : set of hashes known to exist there
+		self.lock = threading.Lock()
+
+	def file_hash(self, path):
+		stat = os.stat(path)
+		stamp = (stat.st_size, stat.st_mtime)
+		with self.lock:
+			cached = self.hashes.get(path)
+		if cached and cached[0] == stamp:
+			return cached[1]
+		h = hashlib.sha256()
+		with open(path, "rb") as f:
+			for chunk in iter(lambda: f.read(1024*1024), b""):
+				h.update(chunk)
+		with self.lock:
+			self.hashes[path] = (stamp, h.hexdigest())
+		return h.hexdigest()
+
+	def remote_name(self, digest, path):
+		return f"{digest[:16]}_{os.path.basename(path)}"
+
+	def exists(self, remote_url, name):
+		"""Check the remote input folder, e.g. after a host restart"""
+		try:
+			r = get_client(remote_url).view(name, self.subfolder, "input")
+			r.close()
+			return r.status_code == 200
+		except Exception:
+			return False
+
+	def ensure(self, remote_url, path):
+		"""Make sure the file is on the remote, returns the name to use in the prompt"""
+		digest = self.file_hash(path)
+		name = self.remote_name(digest, path)
+		with self.lock:
+			known = digest in self.remote.get(remote_url, set())
+		if not known and not self.exists(remote_url, name):
+			with open(path, "rb") as f:
+				get_client(remote_url).upload(name, f, self.subfolder)
+			print(f"NetDist: uploaded '{os.path.basename(path)}' to '{remote_url}'")
+		with self.lock:
+			self.remote.setdefault(remote_url, set()).add(digest)
+		return f"{self.subfolder}/{name}"
+
+	def forget(self, remote_url):
+		with self.lock:
+			self.remote.pop(remote_url, None)
+
+UPLOADS = UploadIndex()
+
+def upload_inputs(remote_url, prompt, nodes=None):
+	"""
+	Upload the local images used by a prompt (PromptOverlay) and point the
+	loaders at the remote copies. nodes limits the check to known loaders.
+	"""
+	for i in (prompt.keys() if nodes is None else nodes):
+		key = UPLOAD_NODES.get(prompt[i]["class_type"])
+		value = prompt[i]["inputs"].get(key) if key else None
+		if type(value) != str:
+			continue
+		path = local_input_path(value)
+		if path is None:
+			print(f"NetDist: local input '{value}' not found, assuming the remote has it")
+			continue
+		prompt.set_input(i, key, UPLOADS.ensure(remote_url, path))
+	return prompt
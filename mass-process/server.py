@@ -1,40 +1,50 @@
 import os
+import sys
 import time
 import yaml
 import json
-import requests
 import argparse
 from PIL import Image
+from io import BytesIO
 from tqdm import tqdm
 from queue import Queue
-from copy import deepcopy
 from threading import Thread
 
+# shared pooled client from the node pack
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.client import get_client
+from core.overlay import PromptOverlay
+from core.utils import get_client_id
+from core.events import get_events
+from core.registry import REGISTRY
+from core.stream import stream_job, EXTRAS_KEY
+
 class JobShard:
 	def __init__(self, workflow, job_num):
 		self.workflow = workflow  # raw workflow
 		self.job_num = job_num    # numerical ID of job
 		self.prompt = None        # created when assigned to worker
 		self.job_id = None        # ^
+		self.prompt_id = None     # returned by the worker on submit
 
 	def format_workflow(self, rep, system, job_num):
-		w = deepcopy(self.workflow)
-		for i in w.keys():
+		w = PromptOverlay(self.workflow) # only changed nodes are copied
+		for i in list(w.keys()):
 			# Fix path mismatch
 			ct = w[i]["class_type"]
 			pr = ("\\","/") if system == "posix" else ("/","\\")
 			if ct == "LoraLoader":
-				w[i]["inputs"]["lora_name"] = w[i]["inputs"]["lora_name"].replace(*pr)
+				w.set_input(i, "lora_name", w[i]["inputs"]["lora_name"].replace(*pr))
 			elif ct == "VAELoader":
-				w[i]["inputs"]["vae_name"] = w[i]["inputs"]["vae_name"].replace(*pr)
+				w.set_input(i, "vae_name", w[i]["inputs"]["vae_name"].replace(*pr))
 			elif ct in ["CheckpointLoader","CheckpointLoaderSimple"]:
-				w[i]["inputs"]["ckpt_name"] = w[i]["inputs"]["ckpt_name"].replace(*pr)
+				w.set_input(i, "ckpt_name", w[i]["inputs"]["ckpt_name"].replace(*pr))
 			# replace strings
-			for k in w[i].get("inputs",{}).keys():
+			for k in list(w[i].get("inputs",{}).keys()):
 				src = w[i]["inputs"][k]
 				dst = [x["dst"] for x in rep if x["src"] == src]
 				if dst:
-					w[i]["inputs"][k] = dst[0].format(job_num=job_num)
+					w.set_input(i, k, dst[0].format(job_num=job_num))
 		self.prompt = w
 
 	def assign(self, worker):
@@ -45,6 +55,7 @@ class Worker:
 	def __init__(self, name, system, url, conf, jobs, prog):
 		self.name = name
 		self.url = url.rstrip("/") if url.endswith("/") else url
+		self.client = get_client(self.url)
 		self.system = system.lower().strip()
 		self.conf = conf # global config
 		self.jobs = jobs # queue of all jobs
@@ -66,49 +77,53 @@ class Worker:
 			self.prog.update()
 
 	def start_job(self):
-		url = f"{self.url}/prompt"
+		get_events(self.url) # listen for results before the job can finish
 		data = {
 			"prompt": self.job.prompt,
-			"client_id": "netdist-mass",
+			"client_id": get_client_id(),
 			"extra_data": {
 				"job_id": self.job.job_id,
 			}
 		}
-		r = requests.post(url, json=data)
+		r = self.client.post_json("/prompt", data)
 		r.raise_for_status()
+		self.job.prompt_id = r.json().get("prompt_id")
+
+	def progress(self, value, total, node):
+		self.prog.set_postfix_str(f"{self.name}: {value}/{total}")
+
+	def output_ids(self):
+		# only the images of the last output node are saved. With a single
+		# output node in the workflow it's streamed live, otherwise the
+		# history picks the last one once the job is done.
+		try:
+			nodes = REGISTRY.get_output_nodes(self.url)
+		except Exception:
+			return None
+		outputs = [i for i,d in self.job.prompt.items() if d["class_type"] in nodes]
+		return outputs if len(outputs) == 1 else None
+
+	def save_image(self, data, count):
+		# first image is saved as <job>.png, renamed once a second one shows up
+		num = self.job.job_num
+		if count == 1:
+			os.replace(f"output/{num}.png", f"output/{num}.0.png")
+		path = f"output/{num}.png" if count == 0 else f"output/{num}.{count}.png"
+		Image.open(BytesIO(data)).save(path)
 
-	def wait_for_job(self):
-		url = self.url + "/history"
-		image_data = None
-		while not image_data:
-			r = requests.get(url)
-			r.raise_for_status()
-			data = r.json()
-			if not data:
-				time.sleep(0.5)
+	def fetch_job(self):
+		# images are saved as soon as the remote reports them
+		count = 0
+		for node, key, info, data in stream_job(self.url, self.job.job_id, self.job.prompt_id, self.output_ids(), self.progress):
+			if key == EXTRAS_KEY:
 				continue
-			for i,d in data.items():
-				if d["prompt"][3].get("job_id") == self.job.job_id:
-					image_data = d["outputs"][list(d["outputs"].keys())[-1]].get("images")
-					break
-			time.sleep(0.5)
-		return image_data
+			self.save_image(data, count)
+			count += 1
+		if self.job.prompt_id:
+			self.client.post("/history", json={"delete": [self.job.prompt_id]})
 
-	def fetch_job(self):
-		images = []
-		for i in self.wait_for_job():
-			img_url = f"{self.url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
-			ir = requests.get(img_url, stream=True)
-			ir.raise_for_status()
-			images.append(Image.open(ir.raw))
-
-		if len(images) == 0:
+		if count == 0:
 			print(f"{self.name}@{self.url} job failed")
-		elif len(images) == 1:
-			images[0].save(f"output/{self.job.job_num}.png")
-		else:
-			for i in range(len(images)):
-				images[i].save(f"output/{self.job.job_num}.{i}.png")
 
 def get_workflow(path):
 	if path.endswith(".png"):
@@ -1,7 +1,12 @@
 from ..core.utils import clean_url, get_client_id, get_new_job_id
-from ..core.dispatch import dispatch_to_remote, clear_remote_queue
+from ..core.scheduler import pick_remote
+from ..core.dispatch import queue_on_remote, get_chain_workers, queue_chain, fetch_settings, worker_signature
+from ..core.affinity import AFFINITY
+from ..core.overlay import PromptOverlay
+from ..core.patch import apply_patches
 
-import copy
+import json
+import time
 
 class RemoteApplyValues:
     """Apply values to remote nodes"""
@@ -92,7 +97,11 @@ class RemoteChainStartNux:
 				"remoteapply8": ("REMOTEAPPLY",),
 				"remoteapply9": ("REMOTEAPPLY",),
 				"remoteapply10": ("REMOTEAPPLY",),
-            }
+            },
+			"hidden": {
+				"prompt": "PROMPT",
+				"unique_id": "UNIQUE_ID",
+			},
 		}
 
 	RETURN_TYPES = ("REMCHAIN",)
@@ -104,10 +113,10 @@ class RemoteChainStartNux:
 	def chain_start(self, workflow, trigger, batch, seed,
 		remoteapply1=None, remoteapply2=None, remoteapply3=None, remoteapply4=None,
 		remoteapply5=None, remoteapply6=None, remoteapply7=None, remoteapply8=None,
-		remoteapply9=None, remoteapply10=None):
+		remoteapply9=None, remoteapply10=None, prompt=None, unique_id=None):
 
-		# Make a deep copy of the workflow to avoid retaining state between calls
-		workflow = copy.deepcopy(workflow)
+		# Copy-on-write view of the workflow to avoid retaining state between calls
+		workflow = PromptOverlay(workflow)
 
 		remote_params = {}
 		for remoteapply in [remoteapply1, remoteapply2, remoteapply3, remoteapply4,
@@ -127,27 +136,8 @@ class RemoteChainStartNux:
 
 		remote_params[("", "seed")] = self.parse_value(seed, "INT")  # Add seed to remote_params
 
-		# Apply remote parameters to the prompt
-		for (nodeid, param), value in remote_params.items():
-			truncated_value = str(value)[:30] + '...' if len(str(value)) > 30 else str(value)  # Truncate value for display
-			print(f"Applying param: {param}, value: {truncated_value}, nodeid: {nodeid}")  # Debug statement
-			if nodeid:
-				if nodeid in workflow:
-					if param in workflow[nodeid].get("inputs", {}):
-						workflow[nodeid]["inputs"][param] = value
-						print(f"Updated node {nodeid} param {param} with value {truncated_value}")  # Debug statement
-					else:
-						print(f"Param {param} not found in node {nodeid} inputs")  # Debug statement
-				else:
-					print(f"Node {nodeid} not found in workflow")  # Debug statement
-			else:
-				for node_key, node_data in workflow.items():
-					if param in node_data.get("inputs", {}):
-						workflow[node_key]["inputs"][param] = value
-						print(f"Updated node {node_key} param {param} with value {truncated_value}")  # Debug statement
-						break
-					else:
-						print(f"Param {param} not found in node {node_key} inputs")  # Debug statement
+		# Apply remote parameters to the prompt, missing targets are reported at once
+		apply_patches(workflow, remote_params)
 
 		remote_chain = {
 			"seed": seed,
@@ -156,10 +146,14 @@ class RemoteChainStartNux:
 			"seed_offset": batch,
 			"job_id": get_new_job_id(),
 		}
+		# dispatch every worker of the chain at once, they just pick up their remote_info
+		if prompt and unique_id:
+			workers = get_chain_workers(prompt, unique_id)
+			remote_chain["remote_infos"] = queue_chain(workflow, remote_chain["job_id"], workers)
 		return(remote_chain,)
 
 	@classmethod
-	def IS_CHANGED(self, workflow, trigger, batch, seed, prompt):
+	def IS_CHANGED(self, workflow, trigger, batch, seed, prompt=None, unique_id=None, **kwargs):
 		uuid = f"W:{workflow},B:{batch},S:{seed}"
 		return uuid if trigger == "on_change" else str(time.time())
 
@@ -204,7 +198,11 @@ class RemoteChainStart:
                 "remote_param4": ("STRING", {"default": ""}),
                 "remote_value4": ("STRING", {"default": ""}),
                 "remote_type4": (["STRING", "INT", "FLOAT", "BOOL"], {"default": "STRING"}),
-            }
+            },
+			"hidden": {
+				"prompt": "PROMPT",
+				"unique_id": "UNIQUE_ID",
+			},
 		}
 
 	RETURN_TYPES = ("REMCHAIN",)
@@ -217,10 +215,11 @@ class RemoteChainStart:
 		remote_nodeid1="", remote_param1="", remote_value1="", remote_type1="STRING",
 		remote_nodeid2="", remote_param2="", remote_value2="", remote_type2="STRING",
 		remote_nodeid3="", remote_param3="", remote_value3="", remote_type3="STRING", 
-		remote_nodeid4="", remote_param4="", remote_value4="", remote_type4="STRING"):
+		remote_nodeid4="", remote_param4="", remote_value4="", remote_type4="STRING",
+		prompt=None, unique_id=None):
 
-		# Make a deep copy of the workflow to avoid retaining state between calls
-		workflow = copy.deepcopy(workflow)
+		# Copy-on-write view of the workflow to avoid retaining state between calls
+		workflow = PromptOverlay(workflow)
 
 		remote_params = {}
 		for nodeid, param, value, value_type in [
@@ -233,27 +232,8 @@ class RemoteChainStart:
 			if param and value:
 				remote_params[(nodeid, param)] = self.parse_value(value, value_type)
 		
-		# Apply remote parameters to the prompt
-		for (nodeid, param), value in remote_params.items():
-			truncated_value = str(value)[:30] + '...' if len(str(value)) > 30 else str(value)  # Truncate value for display
-			print(f"Applying param: {param}, value: {truncated_value}, nodeid: {nodeid}")  # Debug statement
-			if nodeid:
-				if nodeid in workflow:
-					if param in workflow[nodeid].get("inputs", {}):
-						workflow[nodeid]["inputs"][param] = value
-						print(f"Updated node {nodeid} param {param} with value {truncated_value}")  # Debug statement
-					else:
-						print(f"Param {param} not found in node {nodeid} inputs")  # Debug statement
-				else:
-					print(f"Node {nodeid} not found in workflow")  # Debug statement
-			else:
-				for node_key, node_data in workflow.items():
-					if param in node_data.get("inputs", {}):
-						workflow[node_key]["inputs"][param] = value
-						print(f"Updated node {node_key} param {param} with value {truncated_value}")  # Debug statement
-						break
-					else:
-						print(f"Param {param} not found in node {node_key} inputs")  # Debug statement
+		# Apply remote parameters to the prompt, missing targets are reported at once
+		apply_patches(workflow, remote_params)
 
 		remote_chain = {
 			"seed": seed,
@@ -262,10 +242,14 @@ class RemoteChainStart:
 			"seed_offset": batch,
 			"job_id": get_new_job_id(),
 		}
+		# dispatch every worker of the chain at once, they just pick up their remote_info
+		if prompt and unique_id:
+			workers = get_chain_workers(prompt, unique_id)
+			remote_chain["remote_infos"] = queue_chain(workflow, remote_chain["job_id"], workers)
 		return(remote_chain,)
 
 	@classmethod
-	def IS_CHANGED(self, workflow, trigger, batch, seed, prompt):
+	def IS_CHANGED(self, workflow, trigger, batch, seed, prompt=None, unique_id=None, **kwargs):
 		uuid = f"W:{workflow},B:{batch},S:{seed}"
 		return uuid if trigger == "on_change" else str(time.time())
 
@@ -321,6 +305,15 @@ class RemoteQueueWorker:
                 "enabled": (["true", "false", "remote"],{"default": "true"}),
                 "outputs": (["final_image", "any"],{"default":"final_image"}),
             },
+            "optional": {
+                "queue_mode": (["replace", "append"], {"default": "replace"}),
+                "max_inflight": ("INT", {"default": 2, "min": 1, "max": 64}),
+                "result_cache": (["disabled", "enabled"], {"default": "disabled", "tooltip": "Reuse the stored result when the exact same remote prompt was run before."}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("REMCHAIN", "REMINFO")
@@ -330,7 +323,7 @@ class RemoteQueueWorker:
     TITLE = "Queue on remote (worker)"
 
     def queue(self, remote_chain, remote_url, batch_override, enabled, outputs,
-	):
+              queue_mode="replace", max_inflight=2, result_cache="disabled", prompt=None, unique_id=None):
         current_offset = remote_chain["seed_offset"]
         remote_chain["seed_offset"] += 1 if batch_override == 0 else batch_override
         if enabled == "false":
@@ -342,26 +335,70 @@ class RemoteQueueWorker:
                 remote_chain["batch"] = batch_override
             return (remote_chain, {})
 
-        remote_url = clean_url(remote_url)
-        clear_remote_queue(remote_url)
+        # already dispatched together with the rest of the chain. The chain
+        # start output is cached, so only use it once and only if this node's
+        # settings are still the ones it was dispatched with.
+        dispatched = remote_chain.get("remote_infos", {}).pop(unique_id, None)
+        signature = worker_signature({
+            "remote_url"     : remote_url,
+            "batch_override" : batch_override,
+            "enabled"        : enabled,
+            "outputs"        : outputs,
+            "queue_mode"     : queue_mode,
+            "max_inflight"   : max_inflight,
+            "result_cache"   : result_cache,
+        })
+        if dispatched is not None and dispatched[0] == signature:
+            return (remote_chain, dispatched[1])
+
+        remote_url = pick_remote(clean_url(remote_url, multi=True), remote_chain["prompt"])
         
         # Prepare remote parameters
         remote_params = {}
 
-        dispatch_to_remote(
+        remote_info = queue_on_remote(
             remote_url,
             remote_chain["prompt"],
             remote_chain["job_id"],
             remote_params,
             outputs,
+            queue_mode   = queue_mode,
+            max_inflight = max_inflight,
+            result_cache = result_cache,
         )
-        remote_info = {
-            "remote_url" : remote_url,
-            "job_id"     : remote_chain["job_id"],
-        }
         return (remote_chain, remote_info)
 
+    @classmethod
+    def IS_CHANGED(self, prompt=None, unique_id=None, **kwargs):
+        # the other inputs are covered by the cache, the fetch node settings aren't
+        return fetch_settings(prompt, unique_id)
+
+class RemoteAffinityStats:
+    """Show which models each remote ran last and how many swaps our jobs caused"""
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {}}
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("stats",)
+    FUNCTION = "stats"
+    CATEGORY = "remote/advanced"
+    TITLE = "Remote model affinity"
+    OUTPUT_NODE = True
+
+    def stats(self):
+        text = json.dumps(AFFINITY.stats(), indent=2)
+        return {"ui": {"text": [text]}, "result": (text,)}
+
+    @classmethod
+    def IS_CHANGED(self):
+        return str(time.time())
+
 NODE_CLASS_MAPPINGS = {
+	"RemoteAffinityStats" : RemoteAffinityStats,
 	"RemoteApplyValues(Nux)": RemoteApplyValues, 
 	"RemoteChainStart(Nux)": RemoteChainStartNux,
 	"RemoteChainStart"  : RemoteChainStart,
@@ -7,6 +7,9 @@ from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 from base64 import b64encode
 from io import BytesIO
+import folder_paths
+
+from ..core.codec import encode_tensors
 
 class LoadImageUrl:
 	def __init__(self):
@@ -89,6 +92,52 @@ class SaveImageUrl:
 			r.raise_for_status()
 		return ()
 
+class PreviewImageNetDist:
+	"""
+	Output node used on the remote in place of FetchRemote when a wire format
+	other than the default PNG is picked. webp is lossy but small, raw is
+	uncompressed uint8 pixels for fast links where encoding is the bottleneck.
+	"""
+	def __init__(self):
+		self.output_dir = folder_paths.get_temp_directory()
+
+	@classmethod
+	def INPUT_TYPES(s):
+		return {
+			"required": {
+				"images": ("IMAGE", ),
+				"wire_format": (["png", "webp", "raw"], {"default": "webp"}),
+				"quality": ("INT", {"default": 90, "min": 1, "max": 100}),
+			}
+		}
+
+	RETURN_TYPES = ()
+	OUTPUT_NODE = True
+	FUNCTION = "save_images"
+	CATEGORY = "remote/image"
+	TITLE = "Preview Image (NetDist)"
+
+	def save_images(self, images, wire_format="webp", quality=90):
+		full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path("netdist_image", self.output_dir, images[0].shape[1], images[0].shape[0])
+		ext = "ndt" if wire_format == "raw" else wire_format
+		results = []
+		for image in images:
+			pixels = torch.clamp(image * 255.0, 0, 255).round().to(torch.uint8)
+			file = f"{filename}_{counter:05}_.{ext}"
+			path = os.path.join(full_output_folder, file)
+			if wire_format == "raw":
+				with open(path, "wb") as f:
+					f.write(encode_tensors({"image": pixels[..., :3]}, {"kind": "image"}))
+			else:
+				img = Image.fromarray(pixels.cpu().numpy())
+				if wire_format == "webp":
+					img.save(path, "webp", quality=quality, method=4)
+				else:
+					img.save(path, "png", compress_level=1) # lossless, favor speed
+			results.append({"filename": file, "subfolder": subfolder, "type": "temp"})
+			counter += 1
+		return {"ui": {"netdist_images": results}}
+
 class CombineImageBatch:
 	"""
 	This isn't needed anymore but I used it in too many places so I'm keeping it...
@@ -123,5 +172,6 @@ class CombineImageBatch:
 NODE_CLASS_MAPPINGS = {
 	"LoadImageUrl" : LoadImageUrl,
 	"SaveImageUrl" : SaveImageUrl,
+	"PreviewImageNetDist" : PreviewImageNetDist,
 	"CombineImageBatch" : CombineImageBatch,
 }
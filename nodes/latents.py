@@ -11,6 +11,17 @@ from PIL.PngImagePlugin import PngInfo
 import folder_paths
 import base64
 
+from ..core.codec import (
+	is_codec, to_base64, from_base64,
+	encode_latent, decode_latent, encode_conditioning, decode_conditioning,
+)
+
+CODEC_OPTIONS = {
+	"format": (["npy", "netdist"], {"default": "npy", "tooltip": "netdist is a compact pickle-free binary format, npy is the legacy one."}),
+	"precision": (["fp32", "fp16", "bf16"], {"default": "fp32", "tooltip": "Only used for the netdist format."}),
+	"compression": (["none", "zstd"], {"default": "none", "tooltip": "Only used for the netdist format, requires zstandard."}),
+}
+
 
 
 class LoadLatentNumpy:
@@ -169,6 +180,38 @@ class SaveLatentNumpy:
 		np.save(path, samples["samples"].numpy())
 		return (fname,)
 
+class PreviewLatentNetDist:
+	"""
+	Output node used on the remote in place of FetchRemoteLatent.
+	Saves the latent as a netdist blob in the temp folder for the host to fetch.
+	"""
+	def __init__(self):
+		self.output_dir = folder_paths.get_temp_directory()
+
+	@classmethod
+	def INPUT_TYPES(s):
+		return {
+			"required": {
+				"samples": ("LATENT",),
+			},
+			"optional": {
+				"precision": CODEC_OPTIONS["precision"],
+				"compression": CODEC_OPTIONS["compression"],
+			},
+		}
+
+	RETURN_TYPES = ()
+	OUTPUT_NODE = True
+	FUNCTION = "save"
+	CATEGORY = "remote/latent"
+	TITLE = "Preview Latent (NetDist)"
+
+	def save(self, samples, precision="fp32", compression="none"):
+		full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path("netdist_latent", self.output_dir)
+		fname = f"{filename}_{counter:05}_.ndt"
+		with open(os.path.join(full_output_folder, fname), "wb") as f:
+			f.write(encode_latent(samples, precision, compression))
+		return {"ui": {"latents": [{"filename": fname, "subfolder": subfolder, "type": "temp"}]}}
 
 class LatentToBase64Nux:
     @classmethod
@@ -176,7 +219,8 @@ class LatentToBase64Nux:
         return {
             "required": {
                 "samples": ("LATENT",),
-            }
+            },
+            "optional": CODEC_OPTIONS,
         }
     
     RETURN_TYPES = ("STRING",)
@@ -185,7 +229,10 @@ class LatentToBase64Nux:
     CATEGORY = "remote/latent"
     TITLE = "Latent to Base64"
 
-    def convert(self, samples):
+    def convert(self, samples, format="npy", precision="fp32", compression="none"):
+        if format == "netdist":
+            return (to_base64(encode_latent(samples, precision, compression)),)
+
         # Convert the latent samples to a numpy array
         latent_array = samples["samples"].numpy()
         
@@ -220,7 +267,11 @@ class LoadLatentFromBase64Nux:
     def load(self, base64_latent=""):
         try:
             # Decode the base64 string
-            decoded_data = base64.b64decode(base64_latent)
+            decoded_data = from_base64(base64_latent)
+            if is_codec(decoded_data):
+                latent = decode_latent(decoded_data)
+                latent["samples"] = latent["samples"].to(torch.float32)
+                return (latent,)
             
             # Load the numpy array from the decoded data
             buffer = io.BytesIO(decoded_data)
@@ -250,9 +301,10 @@ class LoadLatentFromBase64Nux:
         if not base64_latent:
             return "Base64 latent string is empty"
         try:
-            decoded_data = base64.b64decode(base64_latent)
-            buffer = io.BytesIO(decoded_data)
-            np.load(buffer)
+            decoded_data = from_base64(base64_latent)
+            if not is_codec(decoded_data):
+                buffer = io.BytesIO(decoded_data)
+                np.load(buffer)
         except:
             return "Invalid base64 latent string"
         return True
@@ -265,7 +317,8 @@ class ConditioningToBase64:
         return {
             "required": {
                 "conditioning": ("CONDITIONING", {"tooltip": "The conditioning to be encoded as base64."}),
-            }
+            },
+            "optional": CODEC_OPTIONS,
         }
     
     RETURN_TYPES = ("STRING",)
@@ -274,7 +327,10 @@ class ConditioningToBase64:
     CATEGORY = "conditioning"
     TITLE = "Conditioning2Base64"
 
-    def convert(self, conditioning):
+    def convert(self, conditioning, format="npy", precision="fp32", compression="none"):
+        if format == "netdist":
+            return (to_base64(encode_conditioning(conditioning, precision, compression)),)
+
         # Extract the conditioning data
         cond_data, cond_meta = conditioning[0]
         
@@ -315,9 +371,11 @@ class ConditioningFromBase64:
     def convert(self, base64_conditioning):
         try:
             # Decode the base64 string
-            decoded_data = base64.b64decode(base64_conditioning)
+            decoded_data = from_base64(base64_conditioning)
+            if is_codec(decoded_data):
+                return (decode_conditioning(decoded_data),)
             
-            # Load the numpy arrays from the decoded data
+            # Legacy npz payloads store the metadata dict as a pickled object array
             buffer = io.BytesIO(decoded_data)
             loaded_data = np.load(buffer, allow_pickle=True)
             
@@ -454,7 +512,8 @@ class SaveImageWithBase64:
 				"workflowName": ("STRING", {"default": "",}),
 				"latent": ("LATENT",),
 				"positive_conditioning": ("CONDITIONING",),
-				"negative_conditioning": ("CONDITIONING",)
+				"negative_conditioning": ("CONDITIONING",),
+				"extras_format": (["png_text", "sidecar", "both"], {"default": "png_text", "tooltip": "png_text embeds base64 in the PNG, sidecar writes binary .ndt files next to it that FetchRemoteWithExtras can download without decoding the image."}),
 			},
 			"hidden": {
 				"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"
@@ -466,7 +525,7 @@ class SaveImageWithBase64:
 	OUTPUT_NODE = True
 	CATEGORY = "image"
 	TITLE = "save conds and latents"
-	def save_images(self, images, filename_prefix="ComfyUI", workflowName="", latent=None, positive_conditioning=None, negative_conditioning=None, prompt=None, extra_pnginfo=None):
+	def save_images(self, images, filename_prefix="ComfyUI", workflowName="", latent=None, positive_conditioning=None, negative_conditioning=None, extras_format="png_text", prompt=None, extra_pnginfo=None):
 		def convertconditioning(conditioning):
 			if isinstance(conditioning, list) and len(conditioning) > 0 and isinstance(conditioning[0], list):
 				# Conditioning is a tuple (cond_data, cond_meta)
@@ -502,6 +561,27 @@ class SaveImageWithBase64:
 		filename_prefix += self.prefix_append
 		full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
 		results = list()
+		sidecars = list()
+		if extras_format in ["sidecar", "both"]:
+			sidecars = self.save_sidecars(full_output_folder, f"{filename.replace('%batch_num%', '0')}_{counter:05}_", subfolder,
+				latent, positive_conditioning, negative_conditioning)
+			if extras_format == "sidecar":
+				latent = positive_conditioning = negative_conditioning = None
+
+		# conditioning is the same for the whole batch, only encode it once
+		p_conditioning_base64 = None
+		if positive_conditioning is not None:
+			p_conditioning_base64 = convertconditioning(positive_conditioning)
+		n_conditioning_base64 = None
+		if negative_conditioning is not None:
+			n_conditioning_base64 = convertconditioning(negative_conditioning)
+
+		# each image gets its own latent slice if the batch sizes line up
+		latent_base64 = None
+		latent_sliced = latent is not None and latent["samples"].shape[0] == len(images)
+		if latent is not None and not latent_sliced:
+			latent_base64 = convertlatent(latent)
+
 		for (batch_number, image) in enumerate(images):
 			i = 255. * image.cpu().numpy()
 			img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
@@ -532,14 +612,15 @@ class SaveImageWithBase64:
 			if extra_pnginfo is not None:
 				for x in extra_pnginfo:
 					metadata.add_text(x, json.dumps(extra_pnginfo[x]))
-			if latent is not None:
-				latent_base64 = convertlatent(latent)
+			if latent_sliced:
+				samples = latent["samples"][batch_number:batch_number+1]
+				metadata.add_text("latent_base64", convertlatent({"samples": samples}))
+				metadata.add_text("latent_slice", f"{batch_number}/{len(images)}")
+			elif latent_base64 is not None:
 				metadata.add_text("latent_base64", latent_base64)
-			if positive_conditioning is not None:
-				p_conditioning_base64 = convertconditioning(positive_conditioning)
+			if p_conditioning_base64 is not None:
 				metadata.add_text("conditioning_base64", p_conditioning_base64)
-			if negative_conditioning is not None:
-				n_conditioning_base64 = convertconditioning(negative_conditioning)
+			if n_conditioning_base64 is not None:
 				metadata.add_text("neg_conditioning_base64", n_conditioning_base64)
 			filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
 			file = f"{filename_with_batch_num}_{counter:05}_.png"
@@ -550,7 +631,36 @@ class SaveImageWithBase64:
 				"type": self.type
 			})
 			counter += 1
-		return { "ui": { "images": results } }
+		return { "ui": { "images": results, "netdist_extras": sidecars } }
+
+	def save_sidecars(self, folder, name, subfolder, latent, positive_conditioning, negative_conditioning):
+		"""Write latent/conditioning as binary netdist files next to the images"""
+		def as_list(conditioning):
+			# bare tensor (embeds) vs [[cond, meta], ...]
+			if isinstance(conditioning, torch.Tensor):
+				return [[conditioning, {}]]
+			return conditioning
+
+		payloads = []
+		if latent is not None:
+			payloads.append(("latent_base64", "latent", encode_latent(latent)))
+		if positive_conditioning is not None:
+			payloads.append(("conditioning_base64", "cond", encode_conditioning(as_list(positive_conditioning))))
+		if negative_conditioning is not None:
+			payloads.append(("neg_conditioning_base64", "neg_cond", encode_conditioning(as_list(negative_conditioning))))
+
+		sidecars = list()
+		for kind, suffix, data in payloads:
+			file = f"{name}.{suffix}.ndt"
+			with open(os.path.join(folder, file), "wb") as f:
+				f.write(data)
+			sidecars.append({
+				"filename": file,
+				"subfolder": subfolder,
+				"type": self.type,
+				"kind": kind,
+			})
+		return sidecars
 
 
 class ExtractBase64FromImageUpload:
@@ -576,6 +686,7 @@ class ExtractBase64FromImageUpload:
         conditioning_base64 = None
 
         if "latent_base64" in img.info:
+            # per-image slice when saved as part of a batch
             latent_base64 = img.info["latent_base64"]
         
         if "conditioning_base64" in img.info:
@@ -607,7 +718,7 @@ class ExtractBase64FromImage:
 
     def extract(self, image):
         # Access the tensor directly
-        tensor = image[0]
+        tensor = image if hasattr(image, 'metadata') else image[0]
         
         latent_base64 = None
         conditioning_base64 = None
@@ -627,6 +738,7 @@ NODE_CLASS_MAPPINGS = {
 	"LoadLatentNumpy": LoadLatentNumpy,
 	"LoadLatentUrl": LoadLatentUrl,
 	"SaveLatentNumpy": SaveLatentNumpy,
+	"PreviewLatentNetDist": PreviewLatentNetDist,
 	"ConditioningToBase64(Nux)": ConditioningToBase64,  # New class
 	"ConditioningFromBase64(Nux)": ConditioningFromBase64,
 	"SaveImageWithBase64(Nux)": SaveImageWithBase64,
@@ -1,6 +1,10 @@
-from ..core.fetch import fetch_from_remote, fetch_from_remote_with_extras
+import time
+
+from ..core.fetch import fetch_from_remote, fetch_from_remote_with_extras, fetch_from_pool, fetch_latent_from_remote
 from ..core.utils import clean_url, get_client_id, get_new_job_id
-from ..core.dispatch import dispatch_to_remote, clear_remote_queue
+from ..core.scheduler import pick_remote
+from ..core.dispatch import queue_on_remote, split_batch, fetch_settings
+from ..core.engine import ENGINE
 
 class FetchRemote():
 	"""
@@ -18,6 +22,13 @@ class FetchRemote():
 				"final_image": ("IMAGE",),
 				"remote_info": ("REMINFO",),
 			},
+			"optional": {
+				"wire_format": (["png", "webp", "raw"], {"default": "png", "tooltip": "How the remote sends images. png is lossless and keeps metadata, webp is lossy but small (slow links), raw is uncompressed pixels (fast LAN)."}),
+				"quality": ("INT", {"default": 90, "min": 1, "max": 100, "tooltip": "webp quality."}),
+			},
+			"hidden": {
+				"unique_id": "UNIQUE_ID",
+			},
 		}
 
 	RETURN_TYPES = ("IMAGE",)
@@ -25,15 +36,56 @@ class FetchRemote():
 	CATEGORY = "remote"
 	TITLE = "Fetch from remote"
 
-	def fetch(self, final_image, remote_info):
-		out = fetch_from_remote(
-			remote_url = remote_info.get("remote_url"),
-			job_id     = remote_info.get("job_id"),
-		)
+	def fetch(self, final_image, remote_info, wire_format="png", quality=90, unique_id=None):
+		# several fetch nodes can read different outputs of the same job
+		if "jobs" in remote_info:
+			out = fetch_from_pool(remote_info["jobs"], unique_id)
+		else:
+			out = fetch_from_remote(
+				remote_url = remote_info.get("remote_url"),
+				job_id     = remote_info.get("job_id"),
+				prompt_id  = remote_info.get("prompt_id"),
+				cache_key  = remote_info.get("cache_key"),
+				output_id  = remote_info.get("outputs", {}).get(unique_id),
+			)
 		if out is None:
 			out = final_image[:1] * 0.0 # black image
 		return (out,)
 
+class FetchRemoteLatent():
+	"""
+	Retrieve the final latent from the remote client, without VAE decode/PNG.
+	On the remote client, this is replaced with a latent preview node.
+	"""
+	def __init__(self):
+		pass
+
+	@classmethod
+	def INPUT_TYPES(s):
+		return {
+			"required": {
+				"final_latent": ("LATENT",),
+				"remote_info": ("REMINFO",),
+			},
+			"optional": {
+				"precision": (["fp32", "fp16", "bf16"], {"default": "fp32", "tooltip": "Precision used for the transfer, the latent is cast back on the host."}),
+			},
+			"hidden": {
+				"unique_id": "UNIQUE_ID",
+			},
+		}
+
+	RETURN_TYPES = ("LATENT",)
+	FUNCTION = "fetch"
+	CATEGORY = "remote"
+	TITLE = "Fetch latent from remote"
+
+	def fetch(self, final_latent, remote_info, precision="fp32", unique_id=None):
+		out = fetch_latent_from_remote(remote_info, unique_id)
+		if out is None:
+			out = {"samples": final_latent["samples"][:1] * 0.0} # empty latent
+		return (out,)
+
 #with extras returns, the image, remote latent and conditioning if there are any
 class FetchRemoteWithExtras():
     """
@@ -51,6 +103,9 @@ class FetchRemoteWithExtras():
                 "final_image": ("IMAGE",),
                 "remote_info": ("REMINFO",),
             },
+            "optional": {
+                "decode_images": (["true", "false"], {"default": "true", "tooltip": "Set to false to only fetch the latent/conditioning sidecars without decoding the images."}),
+            },
         }
 
     RETURN_TYPES = ("IMAGE", "STRING", "STRING", "STRING")
@@ -59,10 +114,13 @@ class FetchRemoteWithExtras():
     CATEGORY = "remote"
     TITLE = "Fetch from remote"
 
-    def fetch(self, final_image, remote_info):
+    def fetch(self, final_image, remote_info, decode_images="true"):
         out, metadata = fetch_from_remote_with_extras(
             remote_url = remote_info.get("remote_url"),
             job_id     = remote_info.get("job_id"),
+            prompt_id  = remote_info.get("prompt_id"),
+            cache_key  = remote_info.get("cache_key"),
+            decode     = decode_images == "true",
         )
         if out is None:
             out = final_image[:1] * 0.0 # black image
@@ -108,9 +166,13 @@ class RemoteQueueSimpleNux():
 				"remoteapply8": ("REMOTEAPPLY",),
 				"remoteapply9": ("REMOTEAPPLY",),
 				"remoteapply10": ("REMOTEAPPLY",),
+				"queue_mode": (["replace", "append"], {"default": "replace"}),
+				"max_inflight": ("INT", {"default": 2, "min": 1, "max": 64}),
+				"result_cache": (["disabled", "enabled"], {"default": "disabled", "tooltip": "Reuse the stored result when the exact same remote prompt was run before."}),
             },
             "hidden": {
                 "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
             },
         }
 
@@ -134,15 +196,14 @@ class RemoteQueueSimpleNux():
     def queue(self, remote_url, batch_local, batch_remote, trigger, enabled, seed, prompt, 
 		remoteapply1=None, remoteapply2=None, remoteapply3=None, remoteapply4=None,
 		remoteapply5=None, remoteapply6=None, remoteapply7=None, remoteapply8=None,
-		remoteapply9=None, remoteapply10=None):
+		remoteapply9=None, remoteapply10=None, queue_mode="replace", max_inflight=2, result_cache="disabled", unique_id=None):
         if enabled == "false":
             return (seed, batch_local, {})
         if enabled == "remote":
             return (seed+batch_local, batch_remote, {})
         
         job_id = get_new_job_id()
-        remote_url = clean_url(remote_url)
-        clear_remote_queue(remote_url)
+        remote_url = pick_remote(clean_url(remote_url, multi=True), prompt)
         
         # Prepare remote parameters
         remote_params = []
@@ -150,29 +211,28 @@ class RemoteQueueSimpleNux():
                             remoteapply5, remoteapply6, remoteapply7, remoteapply8,
                             remoteapply9, remoteapply10]:
             if remoteapply:
-                nodetitle, param, value, value_type = remoteapply
-                if param and value:
-                    remote_params.append((param, self.parse_value(value, value_type), nodetitle))
+                # RemoteApplyValuesMulti outputs a tuple of tuples
+                for nodetitle, param, value, value_type in (remoteapply if isinstance(remoteapply[0], tuple) else [remoteapply]):
+                    if param and value:
+                        remote_params.append((param, self.parse_value(value, value_type), nodetitle))
         
-        dispatch_to_remote(remote_url, prompt, job_id, remote_params)
-        remote_info = {
-            "remote_url" : remote_url,
-            "job_id"     : job_id,
-        }
+        remote_info = queue_on_remote(remote_url, prompt, job_id, remote_params,
+            queue_mode=queue_mode, max_inflight=max_inflight, result_cache=result_cache)
         return (seed, batch_local, remote_info)
 
     @classmethod
     def IS_CHANGED(self, remote_url, batch_local, batch_remote, trigger, enabled, seed, prompt, 
                    remoteapply1=None, remoteapply2=None, remoteapply3=None, remoteapply4=None,
                    remoteapply5=None, remoteapply6=None, remoteapply7=None, remoteapply8=None,
-                   remoteapply9=None, remoteapply10=None):
+                   remoteapply9=None, remoteapply10=None, queue_mode="replace", max_inflight=2, result_cache="disabled", unique_id=None):
         uuid = f"W:{remote_url},B1:{batch_local},B2:{batch_remote},S:{seed},E:{enabled}"
         for i, remoteapply in enumerate([remoteapply1, remoteapply2, remoteapply3, remoteapply4,
                                          remoteapply5, remoteapply6, remoteapply7, remoteapply8,
                                          remoteapply9, remoteapply10], start=1):
             if remoteapply:
-                param, value, value_type, nodetitle = remoteapply
-                uuid += f",RP{i}:{param}:{value}:{value_type}:{nodetitle}"
+                for param, value, value_type, nodetitle in (remoteapply if isinstance(remoteapply[0], tuple) else [remoteapply]):
+                    uuid += f",RP{i}:{param}:{value}:{value_type}:{nodetitle}"
+        uuid += f",F:{fetch_settings(prompt, unique_id)}"
         return uuid if trigger == "on_change" else str(time.time())
 
 class RemoteQueueSimple():
@@ -214,9 +274,13 @@ class RemoteQueueSimple():
                 "remote_value4": ("STRING", {"default": ""}),
                 "remote_type4": (["STRING", "INT", "FLOAT", "BOOL"], {"default": "STRING"}),
                 "remote_nodetitle4": ("STRING", {"default": ""}),  # Added nodetitle
+                "queue_mode": (["replace", "append"], {"default": "replace"}),
+                "max_inflight": ("INT", {"default": 2, "min": 1, "max": 64}),
+                "result_cache": (["disabled", "enabled"], {"default": "disabled", "tooltip": "Reuse the stored result when the exact same remote prompt was run before."}),
             },
             "hidden": {
                 "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
             },
         }
 
@@ -241,15 +305,15 @@ class RemoteQueueSimple():
               remote_param1="", remote_value1="", remote_type1="STRING", remote_nodetitle1="",
               remote_param2="", remote_value2="", remote_type2="STRING", remote_nodetitle2="",
               remote_param3="", remote_value3="", remote_type3="STRING", remote_nodetitle3="",
-              remote_param4="", remote_value4="", remote_type4="STRING", remote_nodetitle4=""):
+              remote_param4="", remote_value4="", remote_type4="STRING", remote_nodetitle4="",
+              queue_mode="replace", max_inflight=2, result_cache="disabled", unique_id=None):
         if enabled == "false":
             return (seed, batch_local, {})
         if enabled == "remote":
             return (seed+batch_local, batch_remote, {})
         
         job_id = get_new_job_id()
-        remote_url = clean_url(remote_url)
-        clear_remote_queue(remote_url)
+        remote_url = pick_remote(clean_url(remote_url, multi=True), prompt)
         
         # Prepare remote parameters
         remote_params = []
@@ -262,11 +326,8 @@ class RemoteQueueSimple():
             if param and value:
                 remote_params.append((param, self.parse_value(value, value_type), nodetitle))
         
-        dispatch_to_remote(remote_url, prompt, job_id, remote_params)
-        remote_info = {
-            "remote_url" : remote_url,
-            "job_id"     : job_id,
-        }
+        remote_info = queue_on_remote(remote_url, prompt, job_id, remote_params,
+            queue_mode=queue_mode, max_inflight=max_inflight, result_cache=result_cache)
         return (seed, batch_local, remote_info)
 
     @classmethod
@@ -274,17 +335,97 @@ class RemoteQueueSimple():
                    remote_param1="", remote_value1="", remote_type1="STRING", remote_nodetitle1="",
                    remote_param2="", remote_value2="", remote_type2="STRING", remote_nodetitle2="",
                    remote_param3="", remote_value3="", remote_type3="STRING", remote_nodetitle3="",
-                   remote_param4="", remote_value4="", remote_type4="STRING", remote_nodetitle4=""):
+                   remote_param4="", remote_value4="", remote_type4="STRING", remote_nodetitle4="",
+                   queue_mode="replace", max_inflight=2, result_cache="disabled", unique_id=None):
         uuid = f"W:{remote_url},B1:{batch_local},B2:{batch_remote},S:{seed},E:{enabled}"
         uuid += f",RP1:{remote_param1}:{remote_value1}:{remote_type1}:{remote_nodetitle1}"
         uuid += f",RP2:{remote_param2}:{remote_value2}:{remote_type2}:{remote_nodetitle2}"
         uuid += f",RP3:{remote_param3}:{remote_value3}:{remote_type3}:{remote_nodetitle3}"
         uuid += f",RP4:{remote_param4}:{remote_value4}:{remote_type4}:{remote_nodetitle4}"
+        uuid += f",F:{fetch_settings(prompt, unique_id)}"
+        return uuid if trigger == "on_change" else str(time.time())
+
+class RemoteQueuePool():
+    """
+    Split one batch across a list of remotes and dispatch to all of them at once.
+    The returned remote_info resolves into a single merged batch in FetchRemote.
+    """
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "remote_url": ("STRING", {
+                    "multiline": True,
+                    "default": "http://127.0.0.1:8288/\nhttp://127.0.0.1:8388/",
+                }),
+                "batch_local": ("INT", {"default": 1, "min": 1, "max": 8}),
+                "batch_remote": ("INT", {"default": 2, "min": 1, "max": 64}),
+                "trigger": (["on_change", "always"],),
+                "enabled": (["true", "false", "remote"],{"default": "true"}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+            },
+            "optional": {
+                "queue_mode": (["replace", "append"], {"default": "replace"}),
+                "max_inflight": ("INT", {"default": 2, "min": 1, "max": 64}),
+                "result_cache": (["disabled", "enabled"], {"default": "disabled", "tooltip": "Reuse the stored result when the exact same remote prompt was run before."}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
+            },
+        }
+
+    RETURN_TYPES = ("INT", "INT", "REMINFO",)
+    RETURN_NAMES = ("seed", "batch", "remote_info",)
+    FUNCTION = "queue"
+    CATEGORY = "remote"
+    TITLE = "Queue on remote (pool)"
+
+    def queue(self, remote_url, batch_local, batch_remote, trigger, enabled, seed, prompt,
+              queue_mode="replace", max_inflight=2, result_cache="disabled", unique_id=None):
+        if enabled == "false":
+            return (seed, batch_local, {})
+        if enabled == "remote":
+            # seed/batch for this remote are set on dispatch
+            return (seed, batch_remote, {})
+
+        job_id = get_new_job_id()
+        urls = clean_url(remote_url, multi=True)
+
+        def dispatch(url, batch, job_seed):
+            return queue_on_remote(url, prompt, job_id, node_inputs={
+                "seed"         : job_seed,
+                "batch_remote" : batch,
+            }, queue_mode=queue_mode, max_inflight=max_inflight, result_cache=result_cache)
+
+        # remotes continue the seed range after the local batch
+        futures = []
+        job_seed = seed + batch_local
+        for url, batch in zip(urls, split_batch(batch_remote, len(urls))):
+            if batch == 0:
+                continue
+            futures.append(ENGINE.dispatch.submit(dispatch, url, batch, job_seed))
+            job_seed += batch
+        remote_info = {
+            "jobs" : [x.result() for x in futures],
+        }
+        return (seed, batch_local, remote_info)
+
+    @classmethod
+    def IS_CHANGED(self, remote_url, batch_local, batch_remote, trigger, enabled, seed, prompt,
+                   queue_mode="replace", max_inflight=2, result_cache="disabled", unique_id=None):
+        uuid = f"W:{remote_url},B1:{batch_local},B2:{batch_remote},S:{seed},E:{enabled}"
+        uuid += f",F:{fetch_settings(prompt, unique_id)}"
         return uuid if trigger == "on_change" else str(time.time())
 
 NODE_CLASS_MAPPINGS = {
     "RemoteQueueSimple(Nux)" : RemoteQueueSimpleNux,
 	"RemoteQueueSimple" : RemoteQueueSimple,
+	"RemoteQueuePool"   : RemoteQueuePool,
 	"FetchRemote"       : FetchRemote,
+	"FetchRemoteLatent" : FetchRemoteLatent,
     "FetchRemoteWithExtras(Nux)": FetchRemoteWithExtras,
 }